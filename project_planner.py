@@ -5,13 +5,23 @@ import plotly.express as px
 import plotly.graph_objects as go
 import datetime
 import json
-import graphviz  # For dependency graph
-from collections import defaultdict
+from collections import defaultdict, deque
 import numpy as np  # For business day calculations
 import logging  # For debugging
 import math
+import functools
+import hashlib
+import heapq
 import calendar # For month names
 import io # For Excel export
+try:
+    from numba import njit  # Optional: compiles the scheduling kernels to machine code when installed
+except ImportError:
+    njit = None
+try:
+    import orjson  # Optional: faster JSON export and cache fingerprints when installed
+except ImportError:
+    orjson = None
 
 # Basic logging setup - Change to DEBUG for more detail
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -44,7 +54,8 @@ if 'config' not in st.session_state:
             },
             'monthly_overrides': {} # Keys are month numbers as strings, e.g., "7" for July
         },
-        'profit_margin_percent': 0.0
+        'profit_margin_percent': 0.0,
+        'buffer_hours_per_day': 0.0 # System hours per day kept free of leveled work
     }
 # Ensure default values if 'config' already exists but lacks keys
 st.session_state.config.setdefault('project_start_date', datetime.date.today())
@@ -65,6 +76,7 @@ st.session_state.config['working_hours'].setdefault('default', {
 })
 st.session_state.config['working_hours'].setdefault('monthly_overrides', {})
 st.session_state.config.setdefault('profit_margin_percent', 0.0)
+st.session_state.config.setdefault('buffer_hours_per_day', 0.0)
 
 # Roles store availability_percent and rate_eur_hr
 if 'roles' not in st.session_state:
@@ -129,7 +141,208 @@ for task in st.session_state.tasks:
 
 # --- HELPER FUNCTIONS ---
 
-def get_working_hours_for_date(target_date: datetime.date, working_hours_config: dict) -> float:
+WEEKDAY_NAMES_EN = list(DAY_NAMES_EN.keys()) # Index matches datetime.date.weekday() (Monday == 0)
+CALENDAR_HORIZON_DAYS = 365 * 5 # Default number of days precomputed by WorkingCalendar
+
+class WorkingCalendar:
+    """
+    Day-by-day working calendar precomputed as NumPy arrays from a working hours configuration.
+
+    Arrays are indexed by day offset from `base_date`, so a lookup is a single array access instead of
+    re-deriving the month key, the weekday name and the schedule dict on every call:
+    - hours: system working hours of each day (default schedule or monthly override).
+    - is_working: True if the day is a working day (hours > 0 and, if weekends are excluded, Monday to Friday).
+    - next_working_idx: offset of the first working day on or after each day (len(hours) if none in range).
+
+    Lookups outside the precomputed range rebuild the arrays over a wider range transparently.
+    """
+
+    def __init__(self, working_hours_config: dict, exclude_weekends: bool, base_date: datetime.date, horizon_days: int = CALENDAR_HORIZON_DAYS):
+        """
+        Builds the calendar arrays.
+
+        Args:
+            working_hours_config: Dictionary containing 'default' and 'monthly_overrides' schedules.
+            exclude_weekends: Boolean indicating if weekends should be strictly excluded.
+            base_date: First date covered by the calendar (day offset 0).
+            horizon_days: Number of days precomputed from base_date.
+        """
+        self.working_hours_config = working_hours_config
+        self.exclude_weekends = exclude_weekends
+        self._weekly_hours_by_month = self._build_weekly_hours_by_month(working_hours_config)
+        self._gantt_weekend_hours_by_month = self._build_gantt_weekend_hours_by_month(working_hours_config)
+        self._build(base_date, max(1, int(horizon_days)))
+
+    @staticmethod
+    def _build_weekly_hours_by_month(working_hours_config: dict) -> np.ndarray:
+        """
+        Builds a (13, 7) table of working hours: row = month number (row 0 unused), column = weekday.
+        Mirrors get_working_hours_for_date: a month override (when it is a dict) replaces the default schedule.
+        """
+        monthly_overrides = working_hours_config.get('monthly_overrides', {})
+        default_schedule = working_hours_config.get('default', {})
+        if isinstance(default_schedule, dict):
+            default_week_hours = [float(default_schedule.get(day_name, 0.0)) for day_name in WEEKDAY_NAMES_EN]
+        else:
+            logging.warning(f"Default schedule not found or not a dict. Working hours config: {working_hours_config}")
+            default_week_hours = [0.0] * 7
+
+        weekly_hours_by_month = np.tile(np.array(default_week_hours, dtype=np.float64), (13, 1))
+        if isinstance(monthly_overrides, dict):
+            for month_num in range(1, 13):
+                month_override = monthly_overrides.get(str(month_num))
+                if isinstance(month_override, dict):
+                    weekly_hours_by_month[month_num] = [float(month_override.get(day_name, 0.0)) for day_name in WEEKDAY_NAMES_EN]
+        return weekly_hours_by_month
+
+    @staticmethod
+    def _build_gantt_weekend_hours_by_month(working_hours_config: dict) -> np.ndarray:
+        """
+        Builds the (13, 7) table the Gantt chart uses for calendar weekends when weekends are excluded:
+        the month override's entry for that day if it has one, otherwise the default schedule's hours.
+        """
+        default_schedule = working_hours_config.get('default', {})
+        if not isinstance(default_schedule, dict):
+            default_schedule = {}
+        gantt_weekend_hours_by_month = np.tile(np.array([float(default_schedule.get(day_name, 0)) for day_name in WEEKDAY_NAMES_EN]), (13, 1))
+        monthly_overrides = working_hours_config.get('monthly_overrides', {})
+        if isinstance(monthly_overrides, dict):
+            for month_num in range(1, 13):
+                month_override = monthly_overrides.get(str(month_num))
+                if not isinstance(month_override, dict):
+                    continue
+                for weekday_num, day_name in enumerate(WEEKDAY_NAMES_EN):
+                    if month_override.get(day_name) is not None:
+                        gantt_weekend_hours_by_month[month_num, weekday_num] = float(month_override[day_name])
+        return gantt_weekend_hours_by_month
+
+    def _build(self, base_date: datetime.date, num_days: int):
+        """Computes the per-day arrays for num_days days starting at base_date."""
+        self.base_date = datetime.date(base_date.year, base_date.month, base_date.day)
+        self.base_ordinal = self.base_date.toordinal()
+        day_offsets = np.arange(num_days)
+        calendar_days = np.datetime64(self.base_date, 'D') + day_offsets
+        weekdays = (calendar_days.astype(np.int64) + 3) % 7 # 1970-01-01 was a Thursday (weekday 3)
+        months = calendar_days.astype('datetime64[M]').astype(np.int64) % 12 + 1
+
+        self.weekdays = weekdays
+        self.months = months
+        self.hours = self._weekly_hours_by_month[months, weekdays]
+        self.is_working = self.hours > 0
+        if self.exclude_weekends:
+            self.is_working &= weekdays < 5 # 0-4 corresponds to Monday-Friday
+        # Reverse running minimum over "own offset if working, else past-the-end" gives the next working offset
+        next_working_candidates = np.where(self.is_working, day_offsets, num_days)
+        self.next_working_idx = np.minimum.accumulate(next_working_candidates[::-1])[::-1]
+
+    def day_index(self, target_date: datetime.date, lookahead_days: int = 0) -> int:
+        """
+        Returns the day offset of target_date, extending the calendar if target_date
+        (or target_date + lookahead_days) falls outside the precomputed range.
+
+        Args:
+            target_date: The date to locate.
+            lookahead_days: Number of days after target_date that must also be covered.
+
+        Returns:
+            The offset of target_date from base_date.
+        """
+        return self.ordinal_index(target_date.toordinal(), lookahead_days)
+
+    def ordinal_index(self, target_ordinal: int, lookahead_days: int = 0) -> int:
+        """Same as day_index, for a date given as its proleptic Gregorian ordinal (date.toordinal())."""
+        day_idx = target_ordinal - self.base_ordinal
+        if day_idx < 0 or day_idx + lookahead_days >= len(self.hours):
+            new_base_ordinal = min(self.base_ordinal, target_ordinal)
+            required_end_ordinal = max(self.base_ordinal + len(self.hours), target_ordinal + lookahead_days + 1)
+            # Grow geometrically so repeated out-of-range lookups stay cheap
+            new_num_days = max(required_end_ordinal - new_base_ordinal, 2 * len(self.hours))
+            self._build(datetime.date.fromordinal(new_base_ordinal), new_num_days)
+            day_idx = target_ordinal - self.base_ordinal
+        return day_idx
+
+    def date_at(self, day_idx: int) -> datetime.date:
+        """Returns the date at the given day offset."""
+        return datetime.date.fromordinal(self.base_ordinal + int(day_idx))
+
+    def working_day_indices(self, start_ordinal: int, num_days: int) -> np.ndarray:
+        """
+        Returns the day offsets of the working days in [start_ordinal, start_ordinal + num_days).
+        The offsets index this calendar's arrays and stay valid until the calendar is extended again.
+        """
+        start_idx = self.ordinal_index(start_ordinal, lookahead_days=num_days)
+        return start_idx + np.flatnonzero(self.is_working[start_idx:start_idx + num_days])
+
+    def gantt_working_mask(self, start_ordinal: int, num_days: int) -> np.ndarray:
+        """
+        Returns which of the num_days days from start_ordinal are drawn as worked in the Gantt chart:
+        days with working hours, where excluded calendar weekends only count if they have hours configured.
+        """
+        start_idx = self.ordinal_index(start_ordinal, lookahead_days=num_days)
+        day_slice = slice(start_idx, start_idx + num_days)
+        gantt_working_mask = self.hours[day_slice] > 0
+        if self.exclude_weekends:
+            weekend_positions = np.flatnonzero(self.weekdays[day_slice] >= 5)
+            weekend_idx = start_idx + weekend_positions
+            gantt_working_mask[weekend_positions] = self._gantt_weekend_hours_by_month[self.months[weekend_idx], self.weekdays[weekend_idx]] > 0
+        return gantt_working_mask
+
+    def hours_for_date(self, target_date: datetime.date) -> float:
+        """Returns the system working hours of target_date."""
+        day_idx = self.day_index(target_date) # May rebuild self.hours, so resolve the index first
+        return float(self.hours[day_idx])
+
+    def next_working_day(self, input_date: datetime.date, max_days_ahead: int) -> datetime.date | None:
+        """
+        Finds the next working day from input_date (inclusive).
+
+        Args:
+            input_date: The starting date for the search.
+            max_days_ahead: Maximum number of days after input_date to look at.
+
+        Returns:
+            The next working day, or None if there is none within max_days_ahead days.
+        """
+        next_working_ordinal = self.next_working_ordinal(input_date.toordinal(), max_days_ahead)
+        if next_working_ordinal is None:
+            return None
+        return datetime.date.fromordinal(next_working_ordinal)
+
+    def next_working_ordinal(self, input_ordinal: int, max_days_ahead: int) -> int | None:
+        """Same as next_working_day, with dates given and returned as ordinals."""
+        day_idx = self.ordinal_index(input_ordinal, lookahead_days=max_days_ahead + 1)
+        next_working_day_idx = int(self.next_working_idx[day_idx])
+        if next_working_day_idx - day_idx > max_days_ahead:
+            return None
+        return self.base_ordinal + next_working_day_idx
+
+def _find_effort_completion_loop(remaining_effort: float, daily_effort: np.ndarray) -> tuple[int, float]:
+    """Plain loop version of find_effort_completion, compiled with Numba when it is available."""
+    for day_position in range(daily_effort.shape[0]):
+        remaining_effort_after_day = remaining_effort - daily_effort[day_position]
+        if remaining_effort_after_day <= 1e-6:
+            return day_position, remaining_effort
+        remaining_effort = remaining_effort_after_day
+    return -1, remaining_effort
+
+def _find_effort_completion_numpy(remaining_effort: float, daily_effort: np.ndarray) -> tuple[int, float]:
+    """NumPy version of find_effort_completion, used when Numba is not installed."""
+    # subtract.accumulate runs sequentially, so the running remainder matches the plain loop bit for bit
+    remaining_effort_after_day = np.subtract.accumulate(np.concatenate(([remaining_effort], daily_effort)))[1:]
+    finishing_positions = np.flatnonzero(remaining_effort_after_day <= 1e-6)
+    if not finishing_positions.size:
+        return -1, float(remaining_effort_after_day[-1]) if daily_effort.size else remaining_effort
+    finishing_position = int(finishing_positions[0])
+    if finishing_position == 0:
+        return 0, remaining_effort
+    return finishing_position, float(remaining_effort_after_day[finishing_position - 1])
+
+# Finds the day on which a block of daily effort completes the remaining effort.
+# Returns (finishing_position, remaining_effort): the remaining effort *before* the finishing day,
+# or (-1, remaining effort after the whole block) if the block does not complete it.
+find_effort_completion = njit(cache=True)(_find_effort_completion_loop) if njit is not None else _find_effort_completion_numpy
+
+def get_working_hours_for_date(target_date: datetime.date, working_hours_config: dict, working_calendar: WorkingCalendar | None = None) -> float:
     """
     Calculates the working hours for a specific date, considering default and monthly overrides.
     Month keys in monthly_overrides are expected to be strings (e.g., "7" for July).
@@ -138,16 +351,20 @@ def get_working_hours_for_date(target_date: datetime.date, working_hours_config:
     Args:
         target_date: The date for which to calculate working hours.
         working_hours_config: Dictionary containing 'default' and 'monthly_overrides' schedules.
+        working_calendar: Optional precomputed calendar for working_hours_config; used for an O(1) lookup.
 
     Returns:
         The number of working hours for the target_date.
     """
+    if working_calendar is not None and isinstance(target_date, datetime.date):
+        return working_calendar.hours_for_date(target_date)
+
     if not isinstance(target_date, datetime.date) or not isinstance(working_hours_config, dict):
         logging.warning(f"Invalid input to get_working_hours_for_date: date={target_date}, config_type={type(working_hours_config)}")
         return 0.0
 
     month_str = str(target_date.month) # Key for monthly_overrides, e.g., "7"
-    day_name = target_date.strftime("%A") # Full day name, e.g., "Monday"
+    day_name = WEEKDAY_NAMES_EN[target_date.weekday()] # Full English day name, e.g., "Monday" (no strftime/locale dependency)
 
     monthly_overrides = working_hours_config.get('monthly_overrides', {})
     default_schedule = working_hours_config.get('default', {})
@@ -164,7 +381,7 @@ def get_working_hours_for_date(target_date: datetime.date, working_hours_config:
         logging.warning(f"Default schedule not found or not a dict for {target_date}. Working hours config: {working_hours_config}")
         return 0.0
 
-def get_next_working_day(input_date: datetime.date, working_hours_config: dict, exclude_weekends: bool) -> datetime.date:
+def get_next_working_day(input_date: datetime.date, working_hours_config: dict, exclude_weekends: bool, working_calendar: WorkingCalendar | None = None) -> datetime.date:
     """
     Finds the next working day from the input_date (inclusive),
     considering working hours and weekend exclusion.
@@ -173,25 +390,18 @@ def get_next_working_day(input_date: datetime.date, working_hours_config: dict,
         input_date: The starting date for the search.
         working_hours_config: Configuration for working hours.
         exclude_weekends: Boolean indicating if weekends should be strictly excluded.
+        working_calendar: Optional precomputed calendar for the same configuration (built on the fly if omitted).
 
     Returns:
         The next working day.
     """
-    next_day = input_date
-    days_checked = 0
-    while days_checked <= 365 * 2: # Safety break to prevent infinite loops
-        day_hours = get_working_hours_for_date(next_day, working_hours_config)
-
-        if day_hours > 0:
-            if exclude_weekends:
-                if next_day.weekday() < 5: # 0-4 corresponds to Monday-Friday
-                    return next_day
-            else: # If not excluding weekends, any day with >0 hours is a working day
-                return next_day
-
-        next_day += datetime.timedelta(days=1)
-        days_checked += 1
+    if working_calendar is None:
+        # Two years of lookahead: the same window the day-by-day scan used to search
+        working_calendar = WorkingCalendar(working_hours_config, exclude_weekends, input_date, horizon_days=365 * 2 + 2)
 
+    next_working_date = working_calendar.next_working_day(input_date, 365 * 2)
+    if next_working_date is not None:
+        return next_working_date
     logging.warning(f"Could not find next working day within 2 years of {input_date}. Returning original + 1 day.")
     return input_date + datetime.timedelta(days=1)
 
@@ -201,6 +411,9 @@ def calculate_estimated_duration_from_effort(effort_ph: float, assignments: list
     Estimates task duration in working days based on effort and resource allocation.
     Uses an average daily hours capacity derived from the default schedule.
 
+    The inputs are reduced to hashable keys (only the values the estimate depends on), so repeated
+    calls with the same effort, assignments and configuration are answered from a memoized result.
+
     Args:
         effort_ph: Total effort in person-hours for the task.
         assignments: List of role assignments for the task.
@@ -214,14 +427,32 @@ def calculate_estimated_duration_from_effort(effort_ph: float, assignments: list
     if effort_ph <= 0 or not assignments:
         return 0.5 # Minimum duration for any task
 
-    default_schedule_hours = working_hours_config.get('default', {})
+    # (role, allocation %, availability %) in assignment order, so sums are accumulated in the same order
+    assignments_key = tuple(
+        (assign['role'], assign.get('allocation', 0), roles_config.get(assign['role'], {}).get('availability_percent', 100.0))
+        for assign in assignments
+    )
+    default_schedule_key = tuple(working_hours_config.get('default', {}).items())
+    return _calculate_estimated_duration_cached(effort_ph, assignments_key, default_schedule_key, exclude_weekends)
+
+@functools.lru_cache(maxsize=64)
+def _default_daily_system_capacity(default_schedule_key: tuple, exclude_weekends: bool) -> float:
+    """
+    Average daily system hours of the default weekly schedule, over the days that are worked.
+    Depends only on the schedule, so it is computed once per configuration instead of per estimate.
+
+    Args:
+        default_schedule_key: (day name, hours) items of the default weekly schedule.
+        exclude_weekends: Boolean indicating if weekends are excluded.
 
+    Returns:
+        The average daily hours, or 0.0 if no day of the default week is worked.
+    """
     avg_daily_hours_sum = 0
     avg_working_days_in_week = 0
-    for day_name_key, hours in default_schedule_hours.items():
+    for day_name_key, hours in default_schedule_key:
         if day_name_key in DAY_NAMES_EN: # Use the English day names mapping
-            day_index = list(DAY_NAMES_EN.keys()).index(day_name_key)
-            is_weekend_day_for_avg = day_index >= 5
+            is_weekend_day_for_avg = WEEKDAY_NAMES_EN.index(day_name_key) >= 5
 
             if hours > 0:
                 if not (exclude_weekends and is_weekend_day_for_avg):
@@ -229,22 +460,35 @@ def calculate_estimated_duration_from_effort(effort_ph: float, assignments: list
                     avg_working_days_in_week += 1
 
     if avg_working_days_in_week == 0:
-        logging.warning("Average working days per week is 0 based on default schedule and exclude_weekends. Cannot estimate duration.")
-        return 999 # Indicates an error or impossibility
+        return 0.0
+    return avg_daily_hours_sum / avg_working_days_in_week
+
+@functools.lru_cache(maxsize=4096)
+def _calculate_estimated_duration_cached(effort_ph: float, assignments_key: tuple, default_schedule_key: tuple, exclude_weekends: bool) -> float:
+    """
+    Memoized body of calculate_estimated_duration_from_effort.
+    The keys hold the configuration values themselves, so a changed configuration simply misses the cache.
 
-    avg_daily_hours_system_capacity = avg_daily_hours_sum / avg_working_days_in_week
+    Args:
+        effort_ph: Total effort in person-hours for the task.
+        assignments_key: (role, allocation %, role availability %) for each assignment.
+        default_schedule_key: (day name, hours) items of the default weekly schedule.
+        exclude_weekends: Boolean indicating if weekends are excluded.
+
+    Returns:
+        Estimated duration in working days (rounded to nearest 0.5).
+    """
+    avg_daily_hours_system_capacity = _default_daily_system_capacity(default_schedule_key, exclude_weekends)
     if avg_daily_hours_system_capacity <= 0:
-        logging.warning("Average daily system capacity is 0. Cannot estimate duration.")
-        return 999
+        logging.warning("Average working days per week is 0 based on default schedule and exclude_weekends. Cannot estimate duration.")
+        return 999 # Indicates an error or impossibility
 
     total_weighted_role_contribution_per_day = 0
-    for assign in assignments:
-        role_name = assign['role']
-        allocation_pct = assign.get('allocation', 0) / 100.0
+    for role_name, allocation_pct, role_availability_pct in assignments_key:
+        allocation_pct = allocation_pct / 100.0
         if allocation_pct <=0: continue
 
-        role_info = roles_config.get(role_name, {})
-        role_availability_pct = role_info.get('availability_percent', 100.0) / 100.0
+        role_availability_pct = role_availability_pct / 100.0
 
         role_effective_hours_on_task_per_day = (avg_daily_hours_system_capacity * role_availability_pct) * allocation_pct
         total_weighted_role_contribution_per_day += role_effective_hours_on_task_per_day
@@ -256,9 +500,13 @@ def calculate_estimated_duration_from_effort(effort_ph: float, assignments: list
     estimated_days = effort_ph / total_weighted_role_contribution_per_day
     return max(0.5, math.ceil(estimated_days * 2) / 2) # Round up to nearest 0.5
 
-def calculate_end_date_from_effort(start_date: datetime.date, effort_ph: float, assignments: list, roles_config: dict, working_hours_config: dict, exclude_weekends: bool) -> datetime.date:
+def calculate_end_date_from_effort(start_date: datetime.date, effort_ph: float, assignments: list, roles_config: dict, working_hours_config: dict, exclude_weekends: bool, working_calendar: WorkingCalendar | None = None) -> datetime.date:
     """
-    Calculates the end date of a task by simulating work day by day based on actual daily working hours and resource allocation.
+    Calculates the end date of a task from the effort the assigned roles produce on each working day
+    (actual daily working hours x role availability x allocation).
+
+    Instead of simulating day by day, the daily task capacity of a block of working days is computed
+    as one array and the finishing day is located by find_effort_completion.
 
     Args:
         start_date: The start date of the task.
@@ -267,6 +515,7 @@ def calculate_end_date_from_effort(start_date: datetime.date, effort_ph: float,
         roles_config: Configuration for roles.
         working_hours_config: Configuration for working hours.
         exclude_weekends: Boolean indicating if weekends are excluded.
+        working_calendar: Optional precomputed calendar for the same configuration (built on the fly if omitted).
 
     Returns:
         The calculated end date of the task.
@@ -275,53 +524,58 @@ def calculate_end_date_from_effort(start_date: datetime.date, effort_ph: float,
         logging.error(f"Invalid start_date type for calculate_end_date_from_effort: {start_date}")
         return start_date # Or raise error
 
+    if working_calendar is None:
+        working_calendar = WorkingCalendar(working_hours_config, exclude_weekends, start_date)
+
     if effort_ph <= 0 or not assignments:
         # For zero effort tasks or tasks with no assignments, end date is the next working day from start.
-        return get_next_working_day(start_date, working_hours_config, exclude_weekends)
-
-    remaining_effort = float(effort_ph)
-    current_date = start_date
+        return get_next_working_day(start_date, working_hours_config, exclude_weekends, working_calendar)
 
     # Ensure the first day is a working day
-    current_date = get_next_working_day(current_date, working_hours_config, exclude_weekends)
-
-    days_simulated = 0
-    MAX_SIM_DAYS = 365 * 5 # Safety break for 5 years
-
-    while remaining_effort > 1e-6 and days_simulated < MAX_SIM_DAYS:
-        days_simulated +=1
-        daily_total_working_hours_system_for_this_day = get_working_hours_for_date(current_date, working_hours_config)
-
-        if daily_total_working_hours_system_for_this_day > 0:
-            effort_done_today = 0
-            for assign in assignments:
-                role_name = assign['role']
-                allocation_to_task_pct = assign.get('allocation', 0) / 100.0
-                if allocation_to_task_pct <= 0: continue
+    first_working_date = working_calendar.next_working_day(start_date, 365 * 2)
+    if first_working_date is None:
+        logging.error(f"calculate_end_date_from_effort: no working day found within 2 years of {start_date}. Check the working hours configuration.")
+        return get_next_working_day(start_date, working_hours_config, exclude_weekends, working_calendar)
 
-                role_detail = roles_config.get(role_name, {})
-                role_general_availability_pct = role_detail.get('availability_percent', 100.0) / 100.0
+    # (availability, allocation) factors of the roles contributing to this task
+    role_contribution_factors = []
+    for assign in assignments:
+        allocation_to_task_pct = assign.get('allocation', 0) / 100.0
+        if allocation_to_task_pct <= 0: continue
+        role_general_availability_pct = roles_config.get(assign['role'], {}).get('availability_percent', 100.0) / 100.0
+        role_contribution_factors.append((role_general_availability_pct, allocation_to_task_pct))
 
-                # Max hours this role can generally work today based on system hours and their availability
-                role_max_hours_today_general = daily_total_working_hours_system_for_this_day * role_general_availability_pct
-                # Hours this role dedicates to *this specific task* today
-                role_hours_on_this_task_today = role_max_hours_today_general * allocation_to_task_pct
+    remaining_effort = float(effort_ph)
+    MAX_SIM_DAYS = 365 * 5 # Safety break: maximum number of working days simulated
+    working_days_simulated = 0
+    block_start_ordinal = first_working_date.toordinal()
+    block_num_days = 366
 
-                effort_done_today += role_hours_on_this_task_today
+    while working_days_simulated < MAX_SIM_DAYS:
+        block_working_idx = working_calendar.working_day_indices(block_start_ordinal, block_num_days)
+        block_working_idx = block_working_idx[:MAX_SIM_DAYS - working_days_simulated]
 
-            remaining_effort -= effort_done_today
-            if remaining_effort <= 1e-6:
-                return current_date # Task finishes on this day
+        if block_working_idx.size:
+            block_system_hours = working_calendar.hours[block_working_idx]
+            daily_task_effort = np.zeros(block_working_idx.size)
+            for role_general_availability_pct, allocation_to_task_pct in role_contribution_factors:
+                # Hours each role dedicates to this task: system hours x general availability x task allocation
+                daily_task_effort += (block_system_hours * role_general_availability_pct) * allocation_to_task_pct
 
-        # Move to the next working day
-        current_date = get_next_working_day(current_date + datetime.timedelta(days=1), working_hours_config, exclude_weekends)
+            finishing_position, remaining_effort = find_effort_completion(remaining_effort, daily_task_effort)
+            if finishing_position >= 0:
+                return working_calendar.date_at(block_working_idx[finishing_position]) # Task finishes on this day
 
+            working_days_simulated += block_working_idx.size
+            last_simulated_date = working_calendar.date_at(block_working_idx[-1])
 
-    if days_simulated >= MAX_SIM_DAYS:
-        logging.error(f"calculate_end_date_from_effort exceeded MAX_SIM_DAYS for task starting {start_date} with original effort {effort_ph}. Remaining: {remaining_effort:.2f} PH. Returning last simulated date: {current_date}.")
-        return current_date # Return the date where simulation stopped
+        block_start_ordinal += block_num_days
+        block_num_days *= 2
 
-    return current_date # Should be caught by remaining_effort <= 1e-6 check
+    # Return the working day after the last simulated one (where the simulation stopped)
+    stop_date = get_next_working_day(last_simulated_date + datetime.timedelta(days=1), working_hours_config, exclude_weekends, working_calendar)
+    logging.error(f"calculate_end_date_from_effort exceeded MAX_SIM_DAYS for task starting {start_date} with original effort {effort_ph}. Remaining: {remaining_effort:.2f} PH. Returning last simulated date: {stop_date}.")
+    return stop_date
 
 def calculate_end_date_from_duration(start_date: datetime.date, duration_days: float, exclude_weekends: bool, working_hours_config: dict) -> datetime.date:
     """
@@ -340,7 +594,8 @@ def calculate_end_date_from_duration(start_date: datetime.date, duration_days: f
     if not isinstance(start_date, datetime.date) or not isinstance(duration_days, (int, float)) or duration_days <= 0:
         return start_date # Or raise error
 
-    current_date = get_next_working_day(start_date, working_hours_config, exclude_weekends)
+    working_calendar = WorkingCalendar(working_hours_config, exclude_weekends, start_date)
+    current_date = get_next_working_day(start_date, working_hours_config, exclude_weekends, working_calendar)
     days_counted = 0.0
 
     # If duration is less than a full day (e.g., 0.5), it finishes on the start day.
@@ -354,7 +609,7 @@ def calculate_end_date_from_duration(start_date: datetime.date, duration_days: f
     days_iterated_in_loop = 0
 
     while days_counted < duration_days:
-        current_date = get_next_working_day(current_date + datetime.timedelta(days=1), working_hours_config, exclude_weekends)
+        current_date = get_next_working_day(current_date + datetime.timedelta(days=1), working_hours_config, exclude_weekends, working_calendar)
         days_counted += 1.0
         days_iterated_in_loop +=1
         if days_iterated_in_loop > safety_limit_days :
@@ -363,19 +618,38 @@ def calculate_end_date_from_duration(start_date: datetime.date, duration_days: f
     return current_date
 
 
-def get_task_by_id(task_id: int, task_list: list) -> dict | None:
+def build_task_index(task_list: list) -> dict:
+    """
+    Builds a {task_id: task} index for constant-time lookups by ID.
+    If an ID appears twice, the first task wins, as with a linear search.
+
+    Args:
+        task_list: The list of tasks to index.
+
+    Returns:
+        A dictionary mapping task IDs to task dictionaries.
+    """
+    task_index = {}
+    for task in task_list:
+        task_index.setdefault(task.get('id'), task)
+    return task_index
+
+def get_task_by_id(task_id: int, task_list: list, task_index: dict | None = None) -> dict | None:
     """
     Retrieves a task from a list by its ID.
 
     Args:
         task_id: The ID of the task to find.
         task_list: The list of tasks to search within.
+        task_index: Optional index of task_list from build_task_index; replaces the linear search.
 
     Returns:
         The task dictionary if found, else None.
     """
     try:
         task_id_int = int(task_id)
+        if task_index is not None:
+            return task_index.get(task_id_int)
         for task in task_list:
             if task.get('id') == task_id_int:
                 return task
@@ -384,18 +658,26 @@ def get_task_by_id(task_id: int, task_list: list) -> dict | None:
          return None
     return None
 
-def get_role_rate(role_name: str) -> float:
+@functools.lru_cache(maxsize=4096)
+def _load_json_list_or_text(json_text: str) -> tuple | str | None:
     """
-    Gets the hourly rate for a given role.
+    Decodes a JSON text once per distinct string (task dependencies and assignments are stored as JSON
+    and parsed many times per run). Lists come back as tuples, but only the container is immutable: the decoded
+    elements (e.g. assignment dicts) are shared by every caller, so callers must copy them instead of mutating them.
 
     Args:
-        role_name: The name of the role.
+        json_text: The JSON text to decode.
 
     Returns:
-        The hourly rate in EUR, or 0 if not found.
+        A tuple for a JSON list, the string for a JSON string, or None for anything else (or malformed JSON).
     """
-    role = st.session_state.roles.get(role_name, {})
-    return role.get("rate_eur_hr", 0.0)
+    try:
+        decoded_value = json.loads(json_text)
+    except (json.JSONDecodeError, TypeError):
+        return None # Ignore malformed JSON
+    if isinstance(decoded_value, list):
+        return tuple(decoded_value)
+    return decoded_value if isinstance(decoded_value, str) else None
 
 def parse_assignments(assign_input: list | str) -> list:
     """
@@ -418,10 +700,9 @@ def parse_assignments(assign_input: list | str) -> list:
                 except (ValueError, TypeError): pass # Ignore invalid allocation
         return valid_assignments
     elif isinstance(assign_input, str) and assign_input.strip():
-        try:
-            assignments = json.loads(assign_input)
-            return parse_assignments(assignments) # Recursive call for parsed list
-        except (json.JSONDecodeError, TypeError): pass # Ignore malformed JSON
+        assignments = _load_json_list_or_text(assign_input)
+        if assignments is not None:
+            return parse_assignments(list(assignments) if isinstance(assignments, tuple) else assignments) # Recursive call for parsed list
     return []
 
 
@@ -466,7 +747,7 @@ def calculate_task_cost_by_effort(task_effort_ph: float, assignments_list: list,
 
         # Effort in PH contributed by this role to this specific task
         effort_by_this_role_for_task = task_effort_ph * proportion_of_effort_by_role
-        hourly_rate = get_role_rate(role_name)
+        hourly_rate = roles_config.get(role_name, {}).get("rate_eur_hr", 0.0) # Rates from the roles_config argument, not st.session_state
         total_cost += effort_by_this_role_for_task * hourly_rate
 
     return total_cost
@@ -489,39 +770,39 @@ def parse_dependencies(dep_input: list | str) -> list[int]:
             except (ValueError, TypeError): pass # Ignore non-integer dependencies
         return valid_deps
     elif isinstance(dep_input, str) and dep_input.strip():
-        try:
-            deps = json.loads(dep_input)
-            if isinstance(deps, list): return parse_dependencies(deps) # Recursive call
-        except (json.JSONDecodeError, TypeError): pass # Ignore malformed JSON
+        deps = _load_json_list_or_text(dep_input)
+        if isinstance(deps, tuple): return parse_dependencies(list(deps)) # Recursive call
     return []
 
-def get_task_name(task_id: int, task_list: list) -> str:
+def get_task_name(task_id: int, task_list: list, task_index: dict | None = None) -> str:
     """
     Gets the name of a task by its ID.
 
     Args:
         task_id: The ID of the task.
         task_list: The list of tasks.
+        task_index: Optional index of task_list from build_task_index.
 
     Returns:
         The task name, or a placeholder if not found.
     """
-    task = get_task_by_id(task_id, task_list)
+    task = get_task_by_id(task_id, task_list, task_index)
     return task.get('name', f"ID {task_id} (Not Found)") if task else f"ID {task_id} (Not Found)"
 
-def format_dependencies_display(dep_str: str, task_list: list) -> str:
+def format_dependencies_display(dep_str: str, task_list: list, task_index: dict | None = None) -> str:
     """
     Formats a JSON string of dependency IDs into a comma-separated string of task names.
 
     Args:
         dep_str: JSON string of dependency task IDs.
         task_list: The list of all tasks.
+        task_index: Optional index of task_list from build_task_index; build it once when formatting many rows.
 
     Returns:
         A comma-separated string of dependency names, or "None".
     """
     dep_list = parse_dependencies(dep_str)
-    return ", ".join([get_task_name(dep_id, task_list) for dep_id in dep_list]) if dep_list else "None"
+    return ", ".join([get_task_name(dep_id, task_list, task_index) for dep_id in dep_list]) if dep_list else "None"
 
 def format_assignments_display(assignments_list: list) -> str:
     """
@@ -538,16 +819,69 @@ def format_assignments_display(assignments_list: list) -> str:
     return ", ".join([f"{a.get('role','Unknown Role')} ({a.get('allocation',0):.0f}%)" for a in valid_assignments])
 
 
-def get_working_segments_from_dates(task_start_date: datetime.date, task_end_date: datetime.date, exclude_weekends: bool, working_hours_config: dict) -> list[tuple[datetime.date, datetime.date]]:
+def build_dependency_graph_dot(tasks_list: list) -> str:
+    """
+    Builds the Graphviz DOT source for the task dependency diagram.
+
+    The DOT text is emitted directly (one line per node/edge) instead of going through
+    graphviz.Digraph, which avoids allocating intermediate node/edge objects and
+    re-serializing the graph; st.graphviz_chart accepts the raw string.
+
+    Args:
+        tasks_list: The list of task dictionaries.
+
+    Returns:
+        The DOT source string of the dependency graph.
+    """
+    status_colors_for_graph = {
+        "Pending": "lightblue", "In Progress": "orange", "Completed": "lightgreen",
+        "Blocked": "lightcoral", "Pending (Leveling Error)": "pink",
+        "Pending (Dependency Error)": "lightgrey", "Pending (Leveled)": "lightyellow"
+    }
+    valid_task_ids_for_graph = {task_graph_node['id'] for task_graph_node in tasks_list}
+    dot_lines = ['// Project Dependency Diagram', 'digraph {', '\trankdir=LR'] # Left-to-Right layout
+
+    for task_node_item in tasks_list:
+        assign_display_for_graph = format_assignments_display(task_node_item.get('assignments', []))
+
+        # Determine duration display for graph node
+        duration_display_for_graph = f"{task_node_item.get('duration_calc_days', '?'):.1f}d (est)" # Default to estimated
+        if 'end_date' in task_node_item and isinstance(task_node_item.get('start_date'), datetime.date) and isinstance(task_node_item.get('end_date'), datetime.date) and task_node_item['end_date'] >= task_node_item['start_date']:
+            actual_duration_val = (task_node_item['end_date'] - task_node_item['start_date']).days + 1
+            duration_display_for_graph = f"{actual_duration_val}d (sched)" # Leveled/Scheduled duration
+
+        node_label_html = f'''<{task_node_item.get('name', 'Unknown Task Name')}<BR/>
+                            <FONT POINT-SIZE="10">
+                            ID: {task_node_item.get('id', '?')}<BR/>
+                            Effort: {task_node_item.get('effort_ph', '?')} PH | Dur: {duration_display_for_graph}<BR/>
+                            Status: {task_node_item.get('status', 'N/A')}<BR/>
+                            Assignments: {assign_display_for_graph}
+                            </FONT>>'''
+        node_fill_color = status_colors_for_graph.get(task_node_item.get('status', 'Pending'), 'lightgrey') # Default color
+        dot_lines.append(f'\t{task_node_item["id"]} [label={node_label_html} fillcolor={node_fill_color} shape=box style=filled]')
+
+    # Add edges for dependencies
+    for task_edge_item in tasks_list:
+        for dep_id_edge in parse_dependencies(task_edge_item.get('dependencies', '[]')):
+            if dep_id_edge in valid_task_ids_for_graph: # Ensure dependency exists as a node
+                dot_lines.append(f'\t{dep_id_edge} -> {task_edge_item["id"]}')
+
+    dot_lines.append('}')
+    return "\n".join(dot_lines)
+
+
+def get_working_segments_from_dates(task_start_date: datetime.date, task_end_date: datetime.date, exclude_weekends: bool, working_hours_config: dict, working_calendar: WorkingCalendar | None = None) -> list[tuple[datetime.date, datetime.date]]:
     """
     Identifies continuous working day segments for Gantt chart rendering,
     respecting actual working hours per day and weekend exclusion rules.
+    Segments are the runs of the calendar's Gantt working-day mask, found with np.diff.
 
     Args:
         task_start_date: The start date of the task.
         task_end_date: The end date of the task.
         exclude_weekends: If True, Saturdays and Sundays are non-working unless overridden.
         working_hours_config: The working hours configuration.
+        working_calendar: Optional precomputed calendar for the same configuration (built on the fly if omitted).
 
     Returns:
         A list of tuples, where each tuple is a (segment_start_date, segment_end_date).
@@ -558,45 +892,71 @@ def get_working_segments_from_dates(task_start_date: datetime.date, task_end_dat
        task_start_date > task_end_date:
         return segments
 
-    current_date = task_start_date
-    current_segment_start = None
-
-    while current_date <= task_end_date:
-        day_hours = get_working_hours_for_date(current_date, working_hours_config)
-        is_gantt_working_day = day_hours > 0 # Initially, if hours > 0, it's a working day
-
-        # If exclude_weekends is True, we need to be more specific for Sat/Sun
-        if exclude_weekends and current_date.weekday() >= 5: # It's a Saturday or Sunday
-            # Check if there's a specific monthly override for this weekend day that makes it a working day
-            month_str = str(current_date.month)
-            day_name = current_date.strftime("%A")
-            monthly_override_for_day = working_hours_config.get('monthly_overrides', {}).get(month_str, {}).get(day_name)
-
-            if monthly_override_for_day is not None: # There is a specific override for this month and day
-                is_gantt_working_day = monthly_override_for_day > 0 # Work if override hours > 0
-            else: # No monthly override, check default schedule for this weekend day
-                default_weekend_hours = working_hours_config.get('default',{}).get(day_name,0)
-                is_gantt_working_day = default_weekend_hours > 0 # Work if default weekend hours > 0
-            # If exclude_weekends is strictly enforced, and it's a calendar weekend,
-            # it's only a working day if explicitly configured with >0 hours.
-            # The above logic handles this: if hours are 0 (either by default or override), it's not a working day.
-
-        if is_gantt_working_day:
-            if current_segment_start is None:
-                current_segment_start = current_date
-        else: # Not a working day (or end of a segment)
-            if current_segment_start is not None:
-                # Segment ended on the previous day
-                segments.append((current_segment_start, current_date - datetime.timedelta(days=1)))
-                current_segment_start = None
-
-        # If it's the last day of the task and a segment is open, close it.
-        if current_date == task_end_date and current_segment_start is not None:
-             segments.append((current_segment_start, current_date))
-
-        current_date += datetime.timedelta(days=1)
+    task_start_ordinal = task_start_date.toordinal()
+    num_task_days = task_end_date.toordinal() - task_start_ordinal + 1
+    if working_calendar is None:
+        working_calendar = WorkingCalendar(working_hours_config, exclude_weekends, task_start_date, num_task_days)
+
+    gantt_working_mask = working_calendar.gantt_working_mask(task_start_ordinal, num_task_days)
+    # +1 where a run of working days starts, -1 on the day after it ends
+    run_edges = np.diff(np.concatenate(([0], gantt_working_mask.view(np.int8), [0])))
+    run_starts = np.flatnonzero(run_edges == 1)
+    run_ends = np.flatnonzero(run_edges == -1) - 1
+    for run_start, run_end in zip(run_starts.tolist(), run_ends.tolist()):
+        segments.append((datetime.date.fromordinal(task_start_ordinal + run_start), datetime.date.fromordinal(task_start_ordinal + run_end)))
     return segments
 
+def get_working_segments_for_tasks(task_ids: list, task_start_dates: list, task_end_dates: list, working_calendar: WorkingCalendar) -> pd.DataFrame:
+    """
+    Builds the Gantt working segments of many tasks at once, as a DataFrame made from NumPy arrays.
+    The Gantt working-day mask is computed once over the span of all tasks; each task's segments are the
+    runs of that mask clipped to the task's dates (the same segments get_working_segments_from_dates returns).
+
+    Args:
+        task_ids: Task IDs.
+        task_start_dates: Start date of each task.
+        task_end_dates: End date of each task. Tasks without valid dates, or ending before they start, get no segments.
+        working_calendar: Precomputed calendar of the working hours configuration.
+
+    Returns:
+        A DataFrame with columns 'id', 'plotly_segment_start' and 'plotly_segment_end' (exclusive end, as Plotly expects),
+        one row per segment, in task order.
+    """
+    valid_tasks = [
+        (task_id, task_start.toordinal(), task_end.toordinal())
+        for task_id, task_start, task_end in zip(task_ids, task_start_dates, task_end_dates)
+        if isinstance(task_start, datetime.date) and isinstance(task_end, datetime.date) and task_start <= task_end
+    ]
+    if not valid_tasks:
+        return pd.DataFrame({'id': [], 'plotly_segment_start': pd.to_datetime([]), 'plotly_segment_end': pd.to_datetime([])})
+
+    valid_task_ids = np.array([valid_task[0] for valid_task in valid_tasks])
+    start_ordinals = np.array([valid_task[1] for valid_task in valid_tasks], dtype=np.int64)
+    end_ordinals = np.array([valid_task[2] for valid_task in valid_tasks], dtype=np.int64)
+
+    # Runs of Gantt working days over the span of all tasks, as inclusive ordinal ranges
+    span_start_ordinal = int(start_ordinals.min())
+    gantt_working_mask = working_calendar.gantt_working_mask(span_start_ordinal, int(end_ordinals.max()) - span_start_ordinal + 1)
+    run_edges = np.diff(np.concatenate(([0], gantt_working_mask.view(np.int8), [0])))
+    run_start_ordinals = span_start_ordinal + np.flatnonzero(run_edges == 1)
+    run_end_ordinals = span_start_ordinal + np.flatnonzero(run_edges == -1) - 1
+
+    # Runs overlapping each task: from the first run ending on/after its start to the last run starting on/before its end
+    first_run = np.searchsorted(run_end_ordinals, start_ordinals, side='left')
+    runs_per_task = np.maximum(np.searchsorted(run_start_ordinals, end_ordinals, side='right') - first_run, 0)
+    segment_task_pos = np.repeat(np.arange(len(valid_tasks)), runs_per_task)
+    segment_run = first_run[segment_task_pos] + (np.arange(segment_task_pos.size) - np.repeat(np.cumsum(runs_per_task) - runs_per_task, runs_per_task))
+
+    segment_start_ordinals = np.maximum(run_start_ordinals[segment_run], start_ordinals[segment_task_pos])
+    segment_end_ordinals = np.minimum(run_end_ordinals[segment_run], end_ordinals[segment_task_pos])
+    unix_epoch_ordinal = datetime.date(1970, 1, 1).toordinal()
+    return pd.DataFrame({
+        'id': valid_task_ids[segment_task_pos],
+        'plotly_segment_start': (segment_start_ordinals - unix_epoch_ordinal).astype('datetime64[D]').astype('datetime64[ns]'),
+        # Plotly timeline x_end is exclusive, so add 1 day to the segment end
+        'plotly_segment_end': (segment_end_ordinals + 1 - unix_epoch_ordinal).astype('datetime64[D]').astype('datetime64[ns]'),
+    })
+
 
 def get_ai_project_template_data() -> tuple[dict, list, int]:
     """
@@ -689,74 +1049,62 @@ def get_ai_project_template_data() -> tuple[dict, list, int]:
 
     tasks = []
     task_end_dates_map = {}
-    processed_ids = set()
     exclude_weekends_cfg = st.session_state.config.get('exclude_weekends', True)
     working_hours_cfg = st.session_state.config['working_hours']
+    working_calendar_template = WorkingCalendar(working_hours_cfg, exclude_weekends_cfg, project_start_date)
     task_dict_template = {task['id']: task for task in tasks_structure}
-    ids_to_process_template = sorted(list(task_dict_template.keys()))
-    max_iterations_template = len(ids_to_process_template) * 3 # Increased iterations for complex dependencies
-    iterations_template = 0
-    calculation_ok_template = True
-
-    while len(processed_ids) < len(ids_to_process_template) and iterations_template < max_iterations_template and calculation_ok_template:
-        processed_in_iteration_template = False
-        for task_id_template in ids_to_process_template:
-            if task_id_template in processed_ids: continue
-
-            task_data_template = task_dict_template[task_id_template]
-            dependencies_template = parse_dependencies(task_data_template.get('dependencies', []))
-            deps_met_template = all(dep_id in processed_ids for dep_id in dependencies_template)
-
-            if deps_met_template:
-                start_date_template = calculate_dependent_start_date_for_scheduling(
-                    json.dumps(dependencies_template), task_end_dates_map, project_start_date, working_hours_cfg, exclude_weekends_cfg
-                )
-                if start_date_template is None:
-                    calculation_ok_template = False; break
+    dependencies_by_template_id = {task_id: parse_dependencies(task.get('dependencies', [])) for task_id, task in task_dict_template.items()}
+    # One pass in dependency order (each task after its dependencies) instead of repeated sweeps
+    ordered_template_ids, unresolved_template_ids = order_task_ids_by_dependencies(dependencies_by_template_id)
+    calculation_ok_template = not unresolved_template_ids
+    if unresolved_template_ids:
+        logging.error(f"Template Load: Could not resolve dependencies for tasks {unresolved_template_ids}. Possible circular dependency or data issue.")
+
+    for task_id_template in ordered_template_ids:
+        task_data_template = task_dict_template[task_id_template]
+        dependencies_template = dependencies_by_template_id[task_id_template]
+
+        start_date_template = calculate_dependent_start_date_for_scheduling(
+            dependencies_template, task_end_dates_map, project_start_date, working_hours_cfg, exclude_weekends_cfg, working_calendar_template
+        )
+        if start_date_template is None:
+            calculation_ok_template = False; break
 
-                effort_ph_template = task_data_template.get('effort_ph', 0.0) # Allow 0 for milestones
-                assignments_template = parse_assignments(task_data_template.get('assignments', []))
+        effort_ph_template = task_data_template.get('effort_ph', 0.0) # Allow 0 for milestones
+        assignments_template = parse_assignments(task_data_template.get('assignments', []))
 
-                duration_calc_days_template = calculate_estimated_duration_from_effort(
-                    effort_ph_template, assignments_template, roles_cfg, working_hours_cfg, exclude_weekends_cfg
-                )
-                if effort_ph_template == 0: # Milestone specific duration
-                    duration_calc_days_template = 0.5
+        duration_calc_days_template = calculate_estimated_duration_from_effort(
+            effort_ph_template, assignments_template, roles_cfg, working_hours_cfg, exclude_weekends_cfg
+        )
+        if effort_ph_template == 0: # Milestone specific duration
+            duration_calc_days_template = 0.5
 
 
-                end_date_template = calculate_end_date_from_effort(
-                    start_date_template, effort_ph_template, assignments_template, roles_cfg, working_hours_cfg, exclude_weekends_cfg
-                )
-                if effort_ph_template == 0: # Milestone end date is same as start
-                     end_date_template = start_date_template
-
-
-                if end_date_template is None:
-                    end_date_template = start_date_template
-
-                final_task_template = task_data_template.copy()
-                final_task_template['start_date'] = start_date_template
-                final_task_template['effort_ph'] = effort_ph_template
-                final_task_template['duration_calc_days'] = duration_calc_days_template
-                final_task_template['dependencies'] = json.dumps(dependencies_template)
-                final_task_template['status'] = 'Pending'
-                final_task_template['notes'] = task_data_template.get('notes', '')
-                final_task_template['parent_id'] = None
-                final_task_template['assignments'] = assignments_template
-                final_task_template['phase_color'] = st.session_state.phases.get(final_task_template.get('phase', ''), "#CCCCCC")
-                final_task_template['name'] = f"{final_task_template.get('phase','No Phase')} - {final_task_template.get('subtask','No Subtask')}"
-
-
-                tasks.append(final_task_template)
-                task_end_dates_map[task_id_template] = end_date_template
-                processed_ids.add(task_id_template)
-                processed_in_iteration_template = True
-
-        if not calculation_ok_template: break
-        iterations_template += 1
-        if not processed_in_iteration_template and len(processed_ids) < len(ids_to_process_template):
-            logging.error("Template Load: Could not resolve dependencies for all tasks. Possible circular dependency or data issue.")
-            calculation_ok_template = False; break
+        end_date_template = calculate_end_date_from_effort(
+            start_date_template, effort_ph_template, assignments_template, roles_cfg, working_hours_cfg, exclude_weekends_cfg, working_calendar_template
+        )
+        if effort_ph_template == 0: # Milestone end date is same as start
+             end_date_template = start_date_template
+
+
+        if end_date_template is None:
+            end_date_template = start_date_template
+
+        final_task_template = task_data_template.copy()
+        final_task_template['start_date'] = start_date_template
+        final_task_template['effort_ph'] = effort_ph_template
+        final_task_template['duration_calc_days'] = duration_calc_days_template
+        final_task_template['dependencies'] = json.dumps(dependencies_template)
+        final_task_template['status'] = 'Pending'
+        final_task_template['notes'] = task_data_template.get('notes', '')
+        final_task_template['parent_id'] = None
+        final_task_template['assignments'] = assignments_template
+        final_task_template['phase_color'] = st.session_state.phases.get(final_task_template.get('phase', ''), "#CCCCCC")
+        final_task_template['name'] = f"{final_task_template.get('phase','No Phase')} - {final_task_template.get('subtask','No Subtask')}"
+
+
+        tasks.append(final_task_template)
+        task_end_dates_map[task_id_template] = end_date_template
 
     if not calculation_ok_template:
         st.error("Error calculating template dates. Data was not loaded. Check logs for details.")
@@ -782,21 +1130,22 @@ def get_ai_project_template_data() -> tuple[dict, list, int]:
 
 # --- Resource Leveling Functions ---
 
-def calculate_dependent_start_date_for_scheduling(dependencies_str: str, task_end_dates_map: dict, default_start_date: datetime.date, working_hours_config: dict, exclude_weekends: bool) -> datetime.date | None:
+def calculate_dependent_start_date_for_scheduling(dependencies: list | str, task_end_dates_map: dict, default_start_date: datetime.date, working_hours_config: dict, exclude_weekends: bool, working_calendar: WorkingCalendar | None = None) -> datetime.date | None:
     """
     Calculates the earliest possible start date for a task based on its dependencies' end dates.
 
     Args:
-        dependencies_str: JSON string of dependency task IDs.
+        dependencies: Dependency task IDs, already parsed (list) or as a JSON string.
         task_end_dates_map: A map of {task_id: end_date} for already scheduled tasks.
         default_start_date: The project's default start date if no dependencies.
         working_hours_config: Working hours configuration.
         exclude_weekends: Boolean for weekend exclusion.
+        working_calendar: Optional precomputed calendar for the same configuration.
 
     Returns:
         The calculated earliest start date, or None if a critical dependency is missing.
     """
-    dep_ids = parse_dependencies(dependencies_str)
+    dep_ids = parse_dependencies(dependencies) # A parsed list is only validated, not re-serialized/re-loaded
     latest_dependency_finish_date = None
 
     if dep_ids:
@@ -821,286 +1170,624 @@ def calculate_dependent_start_date_for_scheduling(dependencies_str: str, task_en
     earliest_start = default_start_date
     if latest_dependency_finish_date:
         # Task starts the working day *after* the latest dependency finishes
-        earliest_start = get_next_working_day(latest_dependency_finish_date + datetime.timedelta(days=1), working_hours_config, exclude_weekends)
+        earliest_start = get_next_working_day(latest_dependency_finish_date + datetime.timedelta(days=1), working_hours_config, exclude_weekends, working_calendar)
     else:
         # No dependencies, task can start on the project start date (or next working day)
-        earliest_start = get_next_working_day(default_start_date, working_hours_config, exclude_weekends)
+        earliest_start = get_next_working_day(default_start_date, working_hours_config, exclude_weekends, working_calendar)
 
     return earliest_start
 
+def calculate_dependent_start_ordinal_for_scheduling(dep_ids: list, task_end_ordinals: dict, default_start_ordinal: int, working_calendar: WorkingCalendar) -> int | None:
+    """
+    Ordinal version of calculate_dependent_start_date_for_scheduling used inside the resource leveler,
+    where dates are kept as integer ordinals (date.toordinal()) until they are written back to the tasks.
+
+    Args:
+        dep_ids: Parsed dependency task IDs.
+        task_end_ordinals: A map of {task_id: end_ordinal} for already scheduled tasks.
+        default_start_ordinal: The project's start ordinal, used if there are no dependencies.
+        working_calendar: Precomputed calendar of the project's working hours configuration.
+
+    Returns:
+        The earliest start as an ordinal, or None if a dependency has not been scheduled.
+    """
+    start_search_ordinal = default_start_ordinal
+    if dep_ids:
+        for dep_id in dep_ids:
+            if dep_id not in task_end_ordinals:
+                logging.error(f"Dependency task ID {dep_id} not found in task_end_ordinals. Cannot calculate start date.")
+                return None # Critical: cannot proceed
+        # Task starts the working day *after* the latest dependency finishes
+        start_search_ordinal = max(task_end_ordinals[dep_id] for dep_id in dep_ids) + 1
+
+    earliest_start_ordinal = working_calendar.next_working_ordinal(start_search_ordinal, 365 * 2)
+    if earliest_start_ordinal is None:
+        logging.warning(f"Could not find next working day within 2 years of {datetime.date.fromordinal(start_search_ordinal)}. Returning original + 1 day.")
+        return start_search_ordinal + 1
+    return earliest_start_ordinal
+
+
+def _daily_effort_capacity_loop(
+    daily_system_hours: np.ndarray,
+    scheduled_hours_for_task_roles: np.ndarray,
+    task_role_availability: np.ndarray,
+    task_role_allocation: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Plain loop version of check_and_get_daily_effort_capacity, compiled with Numba when it is available."""
+    num_days, num_roles = scheduled_hours_for_task_roles.shape
+    available_effort_by_day_and_role_for_this_task = np.zeros((num_days, num_roles))
+    can_schedule_by_day = np.zeros(num_days, dtype=np.bool_)
+    is_milestone = True
+    for role_position in range(num_roles):
+        if task_role_allocation[role_position] > 0:
+            is_milestone = False
+    for day_position in range(num_days):
+        system_hours = daily_system_hours[day_position]
+        total_effort_producible = 0.0
+        if system_hours > 0:
+            for role_position in range(num_roles):
+                role_max_possible_hours_general = system_hours * task_role_availability[role_position]
+                role_remaining_general_capacity = max(0.0, role_max_possible_hours_general - scheduled_hours_for_task_roles[day_position, role_position])
+                potential_hours_for_this_task_from_role = role_max_possible_hours_general * task_role_allocation[role_position]
+                role_effort = max(0.0, min(role_remaining_general_capacity, potential_hours_for_this_task_from_role))
+                available_effort_by_day_and_role_for_this_task[day_position, role_position] = role_effort
+                total_effort_producible += role_effort
+        can_schedule_by_day[day_position] = total_effort_producible > 1e-6 or is_milestone
+    return can_schedule_by_day, available_effort_by_day_and_role_for_this_task
+
+# Fused per-day capacity kernel; without Numba the NumPy expressions in check_and_get_daily_effort_capacity are faster
+_daily_effort_capacity_kernel = njit(cache=True)(_daily_effort_capacity_loop) if njit is not None else None
 
 def check_and_get_daily_effort_capacity(
-    current_date: datetime.date,
-    task_assignments: list,
-    current_resource_schedule_hours: dict, # {date: {role: hours_scheduled}}
-    roles_config: dict,
-    working_hours_config: dict,
-    exclude_weekends: bool
-) -> tuple[bool, dict]:
-    """
-    Checks if a task can be worked on a given date and calculates the available effort (in PH)
-    each assigned role can contribute to THIS task on THIS date, considering their overall availability
+    daily_system_hours: np.ndarray,
+    scheduled_hours_for_task_roles: np.ndarray,
+    task_role_availability: np.ndarray,
+    task_role_allocation: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Checks on which days of a block a task can be worked on and calculates the available effort (in PH)
+    each assigned role can contribute to THIS task on each day, considering their overall availability
     and hours already scheduled for them on other tasks.
 
+    Days are rows and assigned roles are columns, so the capacity of a whole block of days is
+    computed in one NumPy expression.
+
     Args:
-        current_date: The date to check.
-        task_assignments: Assignments for the specific task being scheduled.
-        current_resource_schedule_hours: Hours already scheduled for roles on this date across all tasks.
-        roles_config: Configuration for roles (availability).
-        working_hours_config: General working hours configuration.
-        exclude_weekends: Boolean for weekend exclusion.
+        daily_system_hours: System working hours of each day (from the working calendar), shape (days,).
+        scheduled_hours_for_task_roles: Hours already scheduled for each assigned role across all tasks, shape (days, roles).
+        task_role_availability: General availability of each assigned role (0-1), shape (roles,).
+        task_role_allocation: Allocation of each assigned role to this specific task (0-1), shape (roles,).
 
     Returns:
-        A tuple: (can_schedule_today, available_effort_today_by_role_for_this_task)
-        - can_schedule_today (bool): True if any effort can be made on this task today.
-        - available_effort_today_by_role_for_this_task (dict): {role_name: ph_available_for_this_task}
+        A tuple: (can_schedule_by_day, available_effort_by_day_and_role_for_this_task)
+        - can_schedule_by_day (np.ndarray of bool): True for the days on which any effort can be made on this task.
+        - available_effort_by_day_and_role_for_this_task (np.ndarray): PH each assigned role can put into this task each day.
     """
-    daily_system_hours_for_this_day = get_working_hours_for_date(current_date, working_hours_config)
+    if _daily_effort_capacity_kernel is not None:
+        return _daily_effort_capacity_kernel(
+            np.asarray(daily_system_hours, dtype=np.float64), np.ascontiguousarray(scheduled_hours_for_task_roles, dtype=np.float64),
+            np.asarray(task_role_availability, dtype=np.float64), np.asarray(task_role_allocation, dtype=np.float64)
+        )
 
-    if not (daily_system_hours_for_this_day > 0):
-        return False, {} # Not a working day according to system calendar
+    daily_system_hours = np.asarray(daily_system_hours, dtype=np.float64)[:, None]
+    # Max hours each role could *generally* work each day based on system hours and their general availability
+    role_max_possible_hours_general = daily_system_hours * task_role_availability
+    # Remaining general capacity after other tasks, capped by what this task's allocation requests
+    role_remaining_general_capacity = np.maximum(0, role_max_possible_hours_general - scheduled_hours_for_task_roles)
+    potential_hours_for_this_task_from_role = role_max_possible_hours_general * task_role_allocation
+    available_effort_by_day_and_role_for_this_task = np.maximum(0, np.minimum(role_remaining_general_capacity, potential_hours_for_this_task_from_role))
+    # Days that are not working days according to the system calendar get no capacity
+    available_effort_by_day_and_role_for_this_task[daily_system_hours[:, 0] <= 0] = 0.0
+
+    # A day can be scheduled if the sum of available effort for this task from all its assigned roles is > 0
+    # Or, if it's a milestone (no assignments with allocation > 0), it can be "scheduled" (start/end same day)
+    can_schedule_by_day = (available_effort_by_day_and_role_for_this_task.sum(axis=1) > 1e-6) | (not (task_role_allocation > 0).any())
+    return can_schedule_by_day, available_effort_by_day_and_role_for_this_task
 
-    available_effort_today_by_role_for_this_task = {}
-    for assign in task_assignments: # Iterate through roles assigned TO THIS TASK
-        role_name = assign['role']
-        # Allocation percentage of this role's *available time* to *this specific task*
-        allocation_to_this_task_pct = assign.get('allocation', 0) / 100.0
+def update_hourly_schedule_with_effort(
+    day_indices: np.ndarray,
+    task_role_columns: np.ndarray,
+    effort_done_by_day_and_role: np.ndarray,
+    resource_schedule_matrix: np.ndarray
+):
+    """
+    Updates the master resource schedule with the effort contributed by roles to a task on a block of days.
 
-        if allocation_to_this_task_pct <= 0:
-            available_effort_today_by_role_for_this_task[role_name] = 0.0
-            continue
+    Args:
+        day_indices: Rows of the days in the schedule matrix (each day at most once).
+        task_role_columns: Columns of the roles assigned to the task.
+        effort_done_by_day_and_role: Effort (in PH) done by each of those roles on the *current task*, shape (days, roles).
+        resource_schedule_matrix: The master schedule to update, shape (days, roles).
+    """
+    # Broadcast (days, 1) x (roles,) index arrays: the same cells as np.ix_ without its per-call overhead
+    resource_schedule_matrix[day_indices[:, None], task_role_columns] += effort_done_by_day_and_role
 
-        role_detail = roles_config.get(role_name, {})
-        # General availability of the role (e.g., 50% if they work part-time on projects)
-        role_general_availability_pct = role_detail.get('availability_percent', 100.0) / 100.0
+def ensure_schedule_matrix_rows(resource_schedule_matrix: np.ndarray, required_rows: int) -> np.ndarray:
+    """
+    Grows the schedule matrix (with zero rows, doubling its size) until it has at least required_rows rows.
 
-        # Max hours this role could *generally* work today based on system hours and their general availability
-        role_max_possible_hours_today_general = daily_system_hours_for_this_day * role_general_availability_pct
+    Args:
+        resource_schedule_matrix: The schedule matrix, shape (days, roles).
+        required_rows: Minimum number of rows needed.
 
-        # Hours already scheduled for this role on *other tasks* today
-        hours_already_scheduled_for_role_on_other_tasks = current_resource_schedule_hours.get(current_date, {}).get(role_name, 0.0)
+    Returns:
+        The same matrix if large enough, otherwise a larger copy.
+    """
+    current_rows = resource_schedule_matrix.shape[0]
+    if required_rows <= current_rows:
+        return resource_schedule_matrix
+    new_rows = max(required_rows, 2 * current_rows)
+    extra_rows = np.zeros((new_rows - current_rows, resource_schedule_matrix.shape[1]), dtype=resource_schedule_matrix.dtype)
+    return np.vstack([resource_schedule_matrix, extra_rows])
+
+def build_leveled_resource_schedule(resource_schedule_matrix: np.ndarray, base_date: datetime.date, role_names: list) -> dict:
+    """
+    Packs the dense schedule matrix for session state, dropping the unused rows after the last scheduled day.
 
-        # Remaining general capacity for this role today after considering other tasks
-        role_remaining_general_capacity_today = max(0, role_max_possible_hours_today_general - hours_already_scheduled_for_role_on_other_tasks)
+    Args:
+        resource_schedule_matrix: The schedule matrix, shape (days, roles).
+        base_date: Date of row 0.
+        role_names: Role name of each column.
 
-        # Potential hours this role *could* dedicate to *this task* today, if they had full capacity
-        # This is based on the task's specific allocation request for this role
-        potential_hours_for_this_task_from_role = (daily_system_hours_for_this_day * role_general_availability_pct) * allocation_to_this_task_pct
+    Returns:
+        Dictionary with 'base_date', 'role_names' and 'hours_by_day_and_role' (the trimmed matrix).
+    """
+    scheduled_day_rows = np.flatnonzero((resource_schedule_matrix > 0).any(axis=1))
+    num_rows_used = int(scheduled_day_rows[-1]) + 1 if scheduled_day_rows.size else 0
+    return {
+        'base_date': base_date,
+        'role_names': list(role_names),
+        'hours_by_day_and_role': resource_schedule_matrix[:num_rows_used].copy(),
+    }
 
+def leveled_schedule_to_frame(leveled_resource_schedule: dict) -> pd.DataFrame:
+    """
+    Converts a leveled resource schedule (see build_leveled_resource_schedule) into a long DataFrame
+    with one row per day and role with scheduled hours, straight from the matrix.
 
-        # Actual hours this role can contribute to *this task* today is limited by their remaining general capacity
-        # AND the hours requested by this task's allocation for this role.
-        actual_available_for_this_task = max(0, min(role_remaining_general_capacity_today, potential_hours_for_this_task_from_role))
+    Args:
+        leveled_resource_schedule: The schedule stored in st.session_state.leveled_resource_schedule.
 
-        available_effort_today_by_role_for_this_task[role_name] = actual_available_for_this_task
+    Returns:
+        DataFrame with columns 'Date' (datetime64), 'Role' and 'Load (h)', ordered by date then role column.
+    """
+    hours_by_day_and_role = leveled_resource_schedule['hours_by_day_and_role']
+    day_rows, role_cols = np.nonzero(hours_by_day_and_role > 0)
+    base_day = np.datetime64(leveled_resource_schedule['base_date'], 'D')
+    return pd.DataFrame({
+        'Date': (base_day + day_rows).astype('datetime64[ns]'),
+        'Role': np.array(leveled_resource_schedule['role_names'], dtype=object)[role_cols],
+        'Load (h)': hours_by_day_and_role[day_rows, role_cols],
+    })
+
+def approximate_daily_role_load_frame(tasks_df: pd.DataFrame, working_hours_config: dict, working_calendar: WorkingCalendar | None = None) -> pd.DataFrame:
+    """
+    Approximates the daily load per role when no leveled schedule is available: each task's effort is spread
+    evenly over the working days (days with working hours) between its start and end dates, and split between
+    its roles by allocation percentage. Working days come from the calendar's hours array in one slice per task.
 
-    # Can schedule today if the sum of available effort for this task from all its assigned roles is > 0
-    # Or, if it's a milestone (no assignments with allocation > 0), it can be "scheduled" (start/end same day)
-    can_schedule_today = sum(available_effort_today_by_role_for_this_task.values()) > 1e-6 or \
-                         not any(a.get('allocation',0) > 0 for a in task_assignments)
-    return can_schedule_today, available_effort_today_by_role_for_this_task
+    Args:
+        tasks_df: Task DataFrame with 'start_date', 'end_date', 'assignments' and 'effort_ph' columns.
+        working_hours_config: The working hours configuration.
+        working_calendar: Optional precomputed calendar for working_hours_config (built on the fly if omitted).
 
-def update_hourly_schedule_with_effort(
-    current_date: datetime.date,
-    effort_done_by_role_today: dict, # {role_name: hours_contributed_to_current_task}
-    resource_schedule_hours: dict  # Master schedule: {date: {role: total_hours_scheduled_across_tasks}}
-):
+    Returns:
+        DataFrame with columns 'Date' (datetime64), 'Role' and 'Load (h)', one row per task, working day and assignment.
     """
-    Updates the master resource schedule with the effort contributed by roles to a task on a given day.
+    load_day_offsets_chunks, load_hours_chunks, load_role_names = [], [], []
+    valid_start_dates = [start_date for start_date in tasks_df['start_date'] if isinstance(start_date, datetime.date)]
+    if working_calendar is None and valid_start_dates:
+        working_calendar = WorkingCalendar(working_hours_config, False, min(valid_start_dates))
+
+    for task_start_date, task_end_date, task_assignments, task_effort in zip(tasks_df['start_date'], tasks_df['end_date'], tasks_df['assignments'], tasks_df['effort_ph']):
+        assignments_list = parse_assignments(task_assignments)
+        if not (isinstance(task_start_date, datetime.date) and isinstance(task_end_date, datetime.date) and
+                task_start_date <= task_end_date and assignments_list and task_effort > 0):
+            continue
+
+        end_idx = working_calendar.day_index(task_end_date)
+        start_idx = working_calendar.day_index(task_start_date) # May rebuild the arrays, so read them afterwards
+        working_day_offsets = start_idx + np.flatnonzero(working_calendar.hours[start_idx:end_idx + 1] > 0)
+        if len(working_day_offsets) == 0: continue # Avoid division by zero
+
+        avg_effort_per_working_day = task_effort / len(working_day_offsets)
+        # Distribute the task's average daily effort based on each role's allocation to *this task* (a rough approximation)
+        role_shares_per_day = [avg_effort_per_working_day * (assignment.get('allocation', 0) / 100.0) for assignment in assignments_list]
+
+        # One row per working day and assignment, days first (same order as a day-by-day loop)
+        load_day_offsets_chunks.append(np.repeat(working_day_offsets + working_calendar.base_ordinal, len(assignments_list)))
+        load_hours_chunks.append(np.tile(np.array(role_shares_per_day, dtype=np.float64), len(working_day_offsets)))
+        load_role_names.extend([assignment['role'] for assignment in assignments_list] * len(working_day_offsets))
+
+    if not load_hours_chunks:
+        return pd.DataFrame(columns=['Date', 'Role', 'Load (h)'])
+    load_ordinals = np.concatenate(load_day_offsets_chunks)
+    return pd.DataFrame({
+        'Date': (np.datetime64(datetime.date.fromordinal(1), 'D') + (load_ordinals - 1)).astype('datetime64[ns]'),
+        'Role': load_role_names,
+        'Load (h)': np.concatenate(load_hours_chunks),
+    })
+
+def order_task_ids_by_dependencies(dependency_ids_by_task_id: dict, priority_key_by_task_id: dict | None = None) -> tuple[list, list]:
+    """
+    Orders task IDs so that every task comes after all of its dependencies (Kahn's algorithm, O(tasks + edges)).
+
+    Without priority keys, ties are broken by ID priority exactly like an ID-ordered sweep that keeps passing
+    over the pending tasks until all are placed: each task gets the sweep pass in which its dependencies are
+    first all met (a dependency with a higher ID pushes it to the next pass), and the order is (pass, ID).
+    With priority keys, the ready task with the smallest key always comes next (list scheduling with a heap).
 
     Args:
-        current_date: The date the effort was performed.
-        effort_done_by_role_today: Effort (in PH) done by each role on the *current task* today.
-        resource_schedule_hours: The master schedule to update.
+        dependency_ids_by_task_id: Map of {task_id: list of dependency task IDs}.
+        priority_key_by_task_id: Optional map of {task_id: sortable priority key}; smaller keys go first.
+
+    Returns:
+        A tuple (ordered_task_ids, unresolved_task_ids). Unresolved tasks are part of a circular dependency,
+        depend on a task ID that does not exist, or depend on such a task.
     """
-    if current_date not in resource_schedule_hours:
-        resource_schedule_hours[current_date] = defaultdict(float)
+    remaining_dependency_count = {}
+    dependent_task_ids = defaultdict(list)
+    for task_id, dependency_ids in dependency_ids_by_task_id.items():
+        unique_dependency_ids = set(dependency_ids)
+        remaining_dependency_count[task_id] = len(unique_dependency_ids)
+        for dep_id in unique_dependency_ids:
+            dependent_task_ids[dep_id].append(task_id) # Unknown dep IDs never become ready, so dependents stay unresolved
+
+    if priority_key_by_task_id is not None:
+        ready_task_heap = [(priority_key_by_task_id[task_id], task_id) for task_id, count in remaining_dependency_count.items() if count == 0]
+        heapq.heapify(ready_task_heap)
+        ordered_task_ids = []
+        while ready_task_heap:
+            _, task_id = heapq.heappop(ready_task_heap)
+            ordered_task_ids.append(task_id)
+            for dependent_id in dependent_task_ids[task_id]:
+                remaining_dependency_count[dependent_id] -= 1
+                if remaining_dependency_count[dependent_id] == 0:
+                    heapq.heappush(ready_task_heap, (priority_key_by_task_id[dependent_id], dependent_id))
+        unresolved_task_ids = sorted(t_id for t_id, count in remaining_dependency_count.items() if count > 0)
+        return ordered_task_ids, unresolved_task_ids
+
+    sweep_pass_by_task_id = {task_id: 0 for task_id, count in remaining_dependency_count.items() if count == 0}
+    ready_task_ids = deque(sorted(sweep_pass_by_task_id))
+    resolved_task_ids = []
+    while ready_task_ids:
+        task_id = ready_task_ids.popleft()
+        resolved_task_ids.append(task_id)
+        for dependent_id in dependent_task_ids[task_id]:
+            dependent_pass = sweep_pass_by_task_id[task_id] + (1 if task_id > dependent_id else 0)
+            if dependent_pass > sweep_pass_by_task_id.get(dependent_id, 0):
+                sweep_pass_by_task_id[dependent_id] = dependent_pass
+            remaining_dependency_count[dependent_id] -= 1
+            if remaining_dependency_count[dependent_id] == 0:
+                sweep_pass_by_task_id.setdefault(dependent_id, 0)
+                ready_task_ids.append(dependent_id)
+
+    ordered_task_ids = sorted(resolved_task_ids, key=lambda t_id: (sweep_pass_by_task_id[t_id], t_id))
+    unresolved_task_ids = sorted(t_id for t_id, count in remaining_dependency_count.items() if count > 0)
+    return ordered_task_ids, unresolved_task_ids
+
+def compute_critical_path_days(ordered_task_ids: list, dependency_ids_by_task_id: dict, duration_days_by_task_id: dict) -> dict:
+    """
+    Computes the critical path length of each task: its own duration plus the longest chain of tasks
+    that (transitively) depend on it. One reverse pass over a dependency order, O(tasks + edges).
+
+    Args:
+        ordered_task_ids: Task IDs ordered so that every task comes after its dependencies.
+        dependency_ids_by_task_id: Map of {task_id: list of dependency task IDs}.
+        duration_days_by_task_id: Map of {task_id: estimated duration in working days}.
 
-    for role_name, hours_contributed_to_current_task in effort_done_by_role_today.items():
-        if hours_contributed_to_current_task > 0:
-            resource_schedule_hours[current_date][role_name] += hours_contributed_to_current_task
+    Returns:
+        A dictionary {task_id: critical path length in days} for the tasks in ordered_task_ids.
+    """
+    dependent_task_ids = defaultdict(list)
+    for task_id in ordered_task_ids:
+        for dep_id in set(dependency_ids_by_task_id[task_id]):
+            dependent_task_ids[dep_id].append(task_id)
+
+    critical_path_days_by_task_id = {}
+    for task_id in reversed(ordered_task_ids): # Dependents come later in the order, so they are already computed
+        longest_dependent_chain = max((critical_path_days_by_task_id[dependent_id] for dependent_id in dependent_task_ids[task_id]), default=0.0)
+        critical_path_days_by_task_id[task_id] = duration_days_by_task_id[task_id] + longest_dependent_chain
+    return critical_path_days_by_task_id
+
+def fingerprint_for_cache(value) -> str:
+    """
+    Returns a stable content hash of a JSON-like value (dates and other objects hashed via str()),
+    used as an explicit cache key for large session state structures.
+    Serializes with orjson when it is installed (several times faster on large task lists) and the standard library otherwise.
+    """
+    if orjson is not None:
+        try:
+            serialized_value = orjson.dumps(value, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        except orjson.JSONEncodeError: # e.g. integers beyond 64 bits; fall back to the standard library
+            serialized_value = json.dumps(value, sort_keys=True, default=str).encode('utf-8')
+    else:
+        serialized_value = json.dumps(value, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.blake2b(serialized_value, digest_size=16).hexdigest()
 
 def replan_with_resource_leveling(tasks_to_plan: list, roles_config: dict, project_config: dict):
     """
-    Re-schedules tasks considering dependencies and daily resource capacity (effort in PH).
-    This is the core resource leveling logic.
+    Re-schedules tasks considering dependencies and daily resource capacity (effort in PH),
+    then stores the replanned tasks and the leveled resource schedule in session state.
+    The leveling itself is cached on fingerprints of its inputs, so replanning an unchanged project is instant.
 
     Args:
         tasks_to_plan: A list of task dictionaries to be replanned.
         roles_config: Configuration of roles.
         project_config: General project configuration (start date, working hours, etc.).
     """
-    working_hours_config = project_config['working_hours']
-    exclude_weekends = project_config['exclude_weekends']
-    project_start_date = project_config['project_start_date']
-
-    # Sort tasks by ID initially; other sorting (e.g., priority) could be added.
-    # For simplicity, using ID ensures a consistent processing order if other factors are equal.
-    tasks_to_plan.sort(key=lambda t: t.get('id', float('inf')))
-
-    task_end_dates = {} # Stores {task_id: actual_end_date} as tasks get scheduled
-    # Master schedule tracking total hours scheduled per role per day across ALL tasks
-    resource_schedule_hours = defaultdict(lambda: defaultdict(float))
+    planned_tasks, unscheduled_task_ids, leveled_resource_schedule = _leveled_plan(
+        fingerprint_for_cache(tasks_to_plan), fingerprint_for_cache(roles_config), fingerprint_for_cache(project_config),
+        tasks_to_plan, roles_config, project_config
+    )
+    task_map = {t['id']: t for t in planned_tasks}
 
-    unscheduled_task_ids = [t['id'] for t in tasks_to_plan]
-    task_map = {t['id']: t for t in tasks_to_plan} # For quick lookup
+    if unscheduled_task_ids:
+        st.warning(f"Replanning finished, but {len(unscheduled_task_ids)} tasks could not be fully scheduled. IDs: {unscheduled_task_ids}. Check logs for details (e.g., resource conflicts, dependency issues).")
+    else:
+        st.success("Project dates recalculated successfully using resource leveling.")
+    # Store the detailed leveled schedule for workload visualization (empty if no valid complete schedule)
+    st.session_state.leveled_resource_schedule = leveled_resource_schedule
 
-    logging.info(f"Starting resource leveling. Project Start Default: {project_start_date}")
-    MAX_ITERATIONS_SCHEDULING = len(tasks_to_plan) * 3 + 10 # Safety break for outer loop
-    current_scheduling_iteration = 0
+    # Update the main session state tasks with the replanned tasks, in their current order, in a single pass.
+    # Tasks that were not part of tasks_to_plan (e.g., a selective replan, though current impl. is all) are kept as they are.
+    st.session_state.tasks = [task_map.get(task_orig['id'], task_orig) for task_orig in st.session_state.tasks]
 
-    st.session_state.leveled_resource_schedule = {} # Clear previous leveled data
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def _leveled_plan(tasks_hash: str, roles_hash: str, config_hash: str, _tasks_to_plan: list, _roles_config: dict, _project_config: dict) -> tuple[list, list, dict]:
+    """
+    The core resource leveling logic, without any Streamlit calls.
+    Streamlit does not hash the underscore-prefixed arguments; the three fingerprints are the cache key.
 
-    while unscheduled_task_ids and current_scheduling_iteration < MAX_ITERATIONS_SCHEDULING:
-        current_scheduling_iteration += 1
-        scheduled_one_in_this_outer_iteration = False
+    Args:
+        tasks_hash: Fingerprint of _tasks_to_plan.
+        roles_hash: Fingerprint of _roles_config.
+        config_hash: Fingerprint of _project_config.
+        _tasks_to_plan: A list of task dictionaries to be replanned (not modified; the leveler works on copies).
+        _roles_config: Configuration of roles.
+        _project_config: General project configuration (start date, working hours, etc.).
 
-        # Attempt to schedule tasks whose dependencies are met
-        for task_id_to_attempt in list(unscheduled_task_ids): # Iterate on a copy
-            if task_id_to_attempt not in task_map: continue # Task might have been removed or is invalid
+    Returns:
+        A tuple: (planned_tasks, unscheduled_task_ids, leveled_resource_schedule)
+        - planned_tasks (list): The tasks with their leveled dates and statuses.
+        - unscheduled_task_ids (list): IDs of the tasks that could not be scheduled.
+        - leveled_resource_schedule (dict): The packed schedule matrix (see build_leveled_resource_schedule),
+          empty unless every task was scheduled.
+    """
+    tasks_to_plan, roles_config, project_config = _tasks_to_plan, _roles_config, _project_config
+    working_hours_config = project_config['working_hours']
+    exclude_weekends = project_config['exclude_weekends']
+    project_start_date = project_config['project_start_date']
+    # Hours per working day held back from leveling as slack for unplanned work (0 = use the full day)
+    buffer_hours_per_day = max(0.0, float(project_config.get('buffer_hours_per_day', 0.0) or 0.0))
+    # Calendar lookups are precomputed once for the whole replan instead of per simulated day
+    working_calendar = WorkingCalendar(working_hours_config, exclude_weekends, project_start_date)
+
+    # Dates are handled as integer ordinals inside the scheduler and converted back when written to the tasks
+    task_end_ordinals = {} # Stores {task_id: actual_end_ordinal} as tasks get scheduled
+
+    # Shallow copies, made only on a cache miss: the leveler rewrites dates and statuses
+    task_map = {t['id']: t.copy() for t in tasks_to_plan} # For quick lookup
+    # Dependencies and assignments are parsed once per replan; the scheduling loop only works on these lists
+    dependencies_by_task_id = {task_id: parse_dependencies(task.get('dependencies', '[]')) for task_id, task in task_map.items()}
+    assignments_by_task_id = {task_id: parse_assignments(task.get('assignments', [])) for task_id, task in task_map.items()}
+
+    # Master schedule tracking total hours scheduled per role per day across ALL tasks:
+    # dense matrix [day offset from project start, role column] instead of nested dicts keyed by date/role name
+    schedule_role_names = list(roles_config.keys())
+    role_column_by_name = {role_name: role_col for role_col, role_name in enumerate(schedule_role_names)}
+    for task_assignments in assignments_by_task_id.values():
+        for assign in task_assignments:
+            if assign['role'] not in role_column_by_name: # Roles missing from the config still get a column
+                role_column_by_name[assign['role']] = len(schedule_role_names)
+                schedule_role_names.append(assign['role'])
+    schedule_base_ordinal = project_start_date.toordinal()
+    resource_schedule_matrix = np.zeros((CALENDAR_HORIZON_DAYS, max(1, len(schedule_role_names))))
+
+    # Tasks are processed once, in dependency order. Among tasks that are ready, the one heading the longest
+    # remaining chain (critical path) goes first, then the lowest ID. Measured against the project finish this is
+    # least-slack-first: the latest start a task can take without delaying the project is (finish - its chain length).
+    ordered_task_ids, unresolved_task_ids = order_task_ids_by_dependencies(dependencies_by_task_id)
+    duration_days_by_task_id = {}
+    for task_id in ordered_task_ids:
+        task_duration_days = pd.to_numeric(task_map[task_id].get('duration_calc_days'), errors='coerce')
+        duration_days_by_task_id[task_id] = 0.0 if pd.isna(task_duration_days) else float(task_duration_days)
+    # Critical path lengths only drive the scheduling order; they are not written to the (persisted) task dicts
+    critical_path_days_by_task_id = compute_critical_path_days(ordered_task_ids, dependencies_by_task_id, duration_days_by_task_id)
+    ordered_task_ids, _ = order_task_ids_by_dependencies(
+        dependencies_by_task_id, {task_id: (-critical_path_days, task_id) for task_id, critical_path_days in critical_path_days_by_task_id.items()}
+    )
+    for unresolved_task_id in unresolved_task_ids:
+        unresolved_dependencies = dependencies_by_task_id[unresolved_task_id]
+        logging.error(f"Resource Leveling: T{unresolved_task_id} cannot be scheduled: its dependencies {unresolved_dependencies} are circular or reference missing tasks.")
+        task_map[unresolved_task_id]['status'] = "Pending (Dependency Error)"
+
+    # Readiness bitsets (Python ints, one bit per task): a task can be scheduled once all its dependency bits are set
+    task_bit_by_id = {task_id: 1 << task_bit for task_bit, task_id in enumerate(task_map)}
+    dependency_mask_by_task_id = {}
+    for task_id in ordered_task_ids:
+        dependency_mask = 0
+        for dep_id in dependencies_by_task_id[task_id]:
+            dependency_mask |= task_bit_by_id[dep_id]
+        dependency_mask_by_task_id[task_id] = dependency_mask
+    scheduled_task_mask = 0
 
-            task = task_map[task_id_to_attempt]
-            dependencies = parse_dependencies(task.get('dependencies', '[]'))
+    logging.info(f"Starting resource leveling. Project Start Default: {project_start_date}")
+    project_first_working_ordinal = calculate_dependent_start_ordinal_for_scheduling([], task_end_ordinals, schedule_base_ordinal, working_calendar)
 
-            # Check if all dependencies for this task are already scheduled (i.e., have an end date)
-            if not all(dep_id in task_end_dates for dep_id in dependencies):
-                continue # Cannot schedule this task yet, try next one
+    for task_id_to_attempt in ordered_task_ids:
+        task = task_map[task_id_to_attempt]
+        dependencies = dependencies_by_task_id[task_id_to_attempt]
 
-            effort_ph_total = float(task.get('effort_ph', 0.0))
-            assignments = parse_assignments(task.get('assignments', []))
+        # A dependency that could not be scheduled (leveling error) blocks this task
+        if dependency_mask_by_task_id[task_id_to_attempt] & ~scheduled_task_mask:
+            logging.warning(f"T{task_id_to_attempt} skipped: at least one of its dependencies {dependencies} could not be scheduled.")
+            continue
 
-            # Handle Milestones (zero effort or no effective assignments)
-            if effort_ph_total <= 1e-6 or not any(a.get('allocation',0) > 0 for a in assignments):
-                earliest_start_for_milestone = calculate_dependent_start_date_for_scheduling(
-                    json.dumps(dependencies), task_end_dates, project_start_date, working_hours_config, exclude_weekends
-                )
-                if earliest_start_for_milestone is None:
-                    logging.error(f"Iter {current_scheduling_iteration}: Milestone T{task_id_to_attempt} dependency start calculation error.")
-                    task['status'] = "Pending (Dependency Error)"
-                    continue
+        effort_ph_total = float(task.get('effort_ph', 0.0))
+        assignments = assignments_by_task_id[task_id_to_attempt]
 
-                task['start_date'] = earliest_start_for_milestone
-                task['end_date'] = earliest_start_for_milestone # Milestones start and end on the same day
-                task_end_dates[task_id_to_attempt] = earliest_start_for_milestone
-                if task_id_to_attempt in unscheduled_task_ids:
-                    unscheduled_task_ids.remove(task_id_to_attempt)
-                scheduled_one_in_this_outer_iteration = True
-                task['status'] = "Pending (Leveled)"
-                logging.info(f"Iter {current_scheduling_iteration}: SCHEDULED Milestone T{task_id_to_attempt} ('{task.get('name', 'N/A')}') | Start/End: {earliest_start_for_milestone}")
-                continue # Move to next task in unscheduled_task_ids
-
-            # For tasks with effort:
-            earliest_start_based_on_deps = calculate_dependent_start_date_for_scheduling(
-                json.dumps(dependencies), task_end_dates, project_start_date, working_hours_config, exclude_weekends
+        # Tasks without dependencies all start on the project's first working day, looked up once per replan
+        if dependencies:
+            earliest_start_ordinal_based_on_deps = calculate_dependent_start_ordinal_for_scheduling(
+                dependencies, task_end_ordinals, schedule_base_ordinal, working_calendar
             )
-            if earliest_start_based_on_deps is None:
-                logging.error(f"Iter {current_scheduling_iteration}: Cannot determine dependency start for T{task_id_to_attempt}. Critical error.")
+        else:
+            earliest_start_ordinal_based_on_deps = project_first_working_ordinal
+
+        # Handle Milestones (zero effort or no effective assignments)
+        if effort_ph_total <= 1e-6 or not any(a.get('allocation',0) > 0 for a in assignments):
+            if earliest_start_ordinal_based_on_deps is None:
+                logging.error(f"Milestone T{task_id_to_attempt} dependency start calculation error.")
                 task['status'] = "Pending (Dependency Error)"
                 continue
 
-            current_date_for_task_search = earliest_start_based_on_deps
-            remaining_effort_for_task = effort_ph_total
-            actual_task_start_date = None
-            actual_task_end_date = None
-
-            MAX_DAYS_TO_SCHEDULE_ONE_TASK = 365 * 3 # Max search window for a single task
-            days_searched_for_this_task_scheduling = 0
-
-            # This temporary log tracks effort for *this task only* before committing to master schedule
-            temp_task_daily_effort_log = []
-
-            logging.debug(f"Iter {current_scheduling_iteration}: Attempting T{task_id_to_attempt} ('{task.get('name', 'N/A')}'). Effort: {effort_ph_total:.1f} PH. DepStart: {earliest_start_based_on_deps}")
+            earliest_start_for_milestone = datetime.date.fromordinal(earliest_start_ordinal_based_on_deps)
+            task['start_date'] = earliest_start_for_milestone
+            task['end_date'] = earliest_start_for_milestone # Milestones start and end on the same day
+            task_end_ordinals[task_id_to_attempt] = earliest_start_ordinal_based_on_deps
+            scheduled_task_mask |= task_bit_by_id[task_id_to_attempt]
+            task['status'] = "Pending (Leveled)"
+            logging.info(f"SCHEDULED Milestone T{task_id_to_attempt} ('{task.get('name', 'N/A')}') | Start/End: {earliest_start_for_milestone}")
+            continue # Move to next task in dependency order
+
+        # For tasks with effort:
+        if earliest_start_ordinal_based_on_deps is None:
+            logging.error(f"Cannot determine dependency start for T{task_id_to_attempt}. Critical error.")
+            task['status'] = "Pending (Dependency Error)"
+            continue
 
-            # Inner loop: find days to complete this specific task
-            while remaining_effort_for_task > 1e-6 and days_searched_for_this_task_scheduling < MAX_DAYS_TO_SCHEDULE_ONE_TASK:
-                days_searched_for_this_task_scheduling +=1
+        # Role vectors for this task (a role assigned twice keeps its last allocation, as with a dict keyed by role)
+        task_role_factors = {}
+        for assign in assignments:
+            role_general_availability_pct = roles_config.get(assign['role'], {}).get('availability_percent', 100.0) / 100.0
+            task_role_factors[assign['role']] = (role_general_availability_pct, assign.get('allocation', 0) / 100.0)
+        task_role_columns = np.array([role_column_by_name[role_name] for role_name in task_role_factors], dtype=np.intp)
+        task_role_availability = np.array([factors[0] for factors in task_role_factors.values()])
+        task_role_allocation = np.array([factors[1] for factors in task_role_factors.values()])
+
+        remaining_effort_for_task = effort_ph_total
+        actual_task_start_ordinal = None
+        actual_task_end_ordinal = None
+
+        MAX_DAYS_TO_SCHEDULE_ONE_TASK = 365 * 3 # Max search window for a single task (in working days)
+        days_searched_for_this_task_scheduling = 0
+        last_searched_ordinal = earliest_start_ordinal_based_on_deps
+
+        # This temporary log tracks effort for *this task only* before committing to master schedule
+        temp_task_daily_effort_log = []
+
+        logging.debug(f"Attempting T{task_id_to_attempt} ('{task.get('name', 'N/A')}'). Effort: {effort_ph_total:.1f} PH. DepStart: {datetime.date.fromordinal(earliest_start_ordinal_based_on_deps)}")
+
+        # Inner loop: place this task's effort on blocks of working days (one NumPy pass per block)
+        block_start_ordinal = earliest_start_ordinal_based_on_deps
+        block_num_days = 64
+        while remaining_effort_for_task > 1e-6 and days_searched_for_this_task_scheduling < MAX_DAYS_TO_SCHEDULE_ONE_TASK:
+            block_working_idx = working_calendar.working_day_indices(block_start_ordinal, block_num_days)
+            block_working_idx = block_working_idx[:MAX_DAYS_TO_SCHEDULE_ONE_TASK - days_searched_for_this_task_scheduling]
+            block_start_ordinal += block_num_days
+            block_num_days *= 2
+            if not block_working_idx.size:
+                if block_num_days > 365 * 4:
+                    break # No working day in years: the working hours configuration leaves nothing to schedule on
+                continue
 
-                # Check capacity for *this task's assignments* on *this specific day*
-                can_work_on_this_date, effort_capacity_by_role_today_for_this_task = check_and_get_daily_effort_capacity(
-                    current_date_for_task_search, assignments, resource_schedule_hours, roles_config, working_hours_config, exclude_weekends
-                )
+            days_searched_for_this_task_scheduling += block_working_idx.size
+            block_system_hours = working_calendar.hours[block_working_idx]
+            if buffer_hours_per_day > 0:
+                block_system_hours = np.maximum(0.0, block_system_hours - buffer_hours_per_day)
+            block_ordinals = block_working_idx + working_calendar.base_ordinal
+            block_schedule_rows = block_ordinals - schedule_base_ordinal
+            last_searched_ordinal = int(block_ordinals[-1])
+
+            # Check capacity for *this task's assignments* on every day of the block
+            resource_schedule_matrix = ensure_schedule_matrix_rows(resource_schedule_matrix, int(block_schedule_rows[-1]) + 1)
+            can_work_by_day, effort_capacity_by_day_and_role = check_and_get_daily_effort_capacity(
+                block_system_hours,
+                resource_schedule_matrix[block_schedule_rows[:, None], task_role_columns],
+                task_role_availability, task_role_allocation
+            )
+            total_effort_producible_by_day = effort_capacity_by_day_and_role.sum(axis=1)
+            producing_days = np.flatnonzero(can_work_by_day & (total_effort_producible_by_day > 1e-6))
+            if not producing_days.size:
+                continue
 
-                if can_work_on_this_date:
-                    total_effort_producible_today_for_this_task = sum(effort_capacity_by_role_today_for_this_task.values())
-
-                    if total_effort_producible_today_for_this_task > 1e-6:
-                        if actual_task_start_date is None:
-                            actual_task_start_date = current_date_for_task_search
-
-                        effort_to_log_this_day_for_task = min(remaining_effort_for_task, total_effort_producible_today_for_this_task)
-
-                        # Distribute the `effort_to_log_this_day_for_task` among contributing roles proportionally
-                        effort_done_by_role_on_this_date_map = defaultdict(float)
-                        if total_effort_producible_today_for_this_task > 1e-6: # Avoid division by zero
-                            for role_name, role_can_do_today_for_task in effort_capacity_by_role_today_for_this_task.items():
-                                if role_can_do_today_for_task > 1e-6:
-                                    proportion = role_can_do_today_for_task / total_effort_producible_today_for_this_task
-                                    effort_this_role_does_for_task = effort_to_log_this_day_for_task * proportion
-                                    effort_done_by_role_on_this_date_map[role_name] = effort_this_role_does_for_task
-
-                        temp_task_daily_effort_log.append({
-                            'date': current_date_for_task_search,
-                            'effort_by_role': dict(effort_done_by_role_on_this_date_map) # Effort for THIS task
-                        })
-                        remaining_effort_for_task -= effort_to_log_this_day_for_task
-                        actual_task_end_date = current_date_for_task_search # Update end date as work is done
-
-                if remaining_effort_for_task <= 1e-6:
-                    break # Task completed
-
-                current_date_for_task_search = get_next_working_day(current_date_for_task_search + datetime.timedelta(days=1), working_hours_config, exclude_weekends)
-
-            # After inner loop: if task is fully scheduled
-            if remaining_effort_for_task <= 1e-6 and actual_task_start_date and actual_task_end_date:
-                task['start_date'] = actual_task_start_date
-                task['end_date'] = actual_task_end_date
-                task_end_dates[task_id_to_attempt] = actual_task_end_date
-
-                # Commit this task's daily effort to the master resource schedule
-                for daily_log in temp_task_daily_effort_log:
-                    update_hourly_schedule_with_effort(daily_log['date'], daily_log['effort_by_role'], resource_schedule_hours)
-
-                if task_id_to_attempt in unscheduled_task_ids:
-                    unscheduled_task_ids.remove(task_id_to_attempt)
-                scheduled_one_in_this_outer_iteration = True
-                task['status'] = "Pending (Leveled)"
-                logging.info(f"Iter {current_scheduling_iteration}: SCHEDULED T{task_id_to_attempt} ('{task.get('name', 'N/A')}') | Effort: {effort_ph_total:.1f} PH | Start: {actual_task_start_date} | End: {actual_task_end_date}")
+            if actual_task_start_ordinal is None:
+                actual_task_start_ordinal = int(block_ordinals[producing_days[0]])
+
+            # Each producing day logs min(remaining, capacity): full capacity until the day the task completes
+            producing_day_totals = total_effort_producible_by_day[producing_days]
+            finishing_position, remaining_effort_for_task = find_effort_completion(remaining_effort_for_task, producing_day_totals)
+            if finishing_position >= 0:
+                producing_days = producing_days[:finishing_position + 1]
+                effort_to_log_by_day = producing_day_totals[:finishing_position + 1].copy()
+                effort_to_log_by_day[-1] = min(remaining_effort_for_task, effort_to_log_by_day[-1])
+                remaining_effort_for_task = float(remaining_effort_for_task - effort_to_log_by_day[-1])
             else:
-                task['status'] = "Pending (Leveling Error)"
-                logging.warning(f"Iter {current_scheduling_iteration}: Could NOT fully schedule T{task_id_to_attempt} ('{task.get('name', 'N/A')}') within search limit ({MAX_DAYS_TO_SCHEDULE_ONE_TASK} days). Remaining effort: {remaining_effort_for_task:.2f} PH. Searched until {current_date_for_task_search}")
-                # Task remains in unscheduled_task_ids
+                effort_to_log_by_day = producing_day_totals
+
+            # Distribute each day's effort among contributing roles proportionally to their capacity
+            producing_day_capacity = effort_capacity_by_day_and_role[producing_days]
+            effort_done_by_day_and_role = np.where(
+                producing_day_capacity > 1e-6,
+                effort_to_log_by_day[:, None] * (producing_day_capacity / producing_day_totals[:len(producing_days), None]),
+                0.0
+            )
 
-        if not scheduled_one_in_this_outer_iteration and unscheduled_task_ids:
-            logging.error(f"Resource Leveling: Iteration {current_scheduling_iteration} completed but no new tasks were scheduled. Unscheduled: {unscheduled_task_ids}. This might indicate a circular dependency or resource bottleneck that prevents further progress.")
-            # Potentially break here or implement more sophisticated handling for deadlocks
-            pass # Allow loop to continue for MAX_ITERATIONS_SCHEDULING for now
+            temp_task_daily_effort_log.append((block_schedule_rows[producing_days], effort_done_by_day_and_role)) # Effort for THIS task
+            actual_task_end_ordinal = int(block_ordinals[producing_days[-1]]) # Update end date as work is done
 
+        # After inner loop: if task is fully scheduled
+        if remaining_effort_for_task <= 1e-6 and actual_task_start_ordinal and actual_task_end_ordinal:
+            actual_task_start_date = datetime.date.fromordinal(actual_task_start_ordinal)
+            actual_task_end_date = datetime.date.fromordinal(actual_task_end_ordinal)
+            task['start_date'] = actual_task_start_date
+            task['end_date'] = actual_task_end_date
+            task_end_ordinals[task_id_to_attempt] = actual_task_end_ordinal
+            scheduled_task_mask |= task_bit_by_id[task_id_to_attempt]
 
+            # Commit this task's daily effort to the master resource schedule
+            for logged_day_indices, logged_effort_by_day_and_role in temp_task_daily_effort_log:
+                update_hourly_schedule_with_effort(logged_day_indices, task_role_columns, logged_effort_by_day_and_role, resource_schedule_matrix)
+
+            task['status'] = "Pending (Leveled)"
+            logging.info(f"SCHEDULED T{task_id_to_attempt} ('{task.get('name', 'N/A')}') | Effort: {effort_ph_total:.1f} PH | Start: {actual_task_start_date} | End: {actual_task_end_date}")
+        else:
+            task['status'] = "Pending (Leveling Error)"
+            logging.warning(f"Could NOT fully schedule T{task_id_to_attempt} ('{task.get('name', 'N/A')}') within search limit ({MAX_DAYS_TO_SCHEDULE_ONE_TASK} days). Remaining effort: {remaining_effort_for_task:.2f} PH. Searched until {datetime.date.fromordinal(last_searched_ordinal)}")
+
+    # Collect the unscheduled tasks and mark their status in the same pass
+    unscheduled_task_ids = []
+    for task_id in sorted(task_map):
+        if task_id not in task_end_ordinals:
+            unscheduled_task_ids.append(task_id)
+            if task_map[task_id].get('status') != "Pending (Dependency Error)":
+                task_map[task_id]['status'] = "Pending (Leveling Error)"
     if unscheduled_task_ids:
         logging.warning(f"Resource leveling finished with {len(unscheduled_task_ids)} tasks unscheduled: {unscheduled_task_ids}")
-        st.warning(f"Replanning finished, but {len(unscheduled_task_ids)} tasks could not be fully scheduled. IDs: {unscheduled_task_ids}. Check logs for details (e.g., resource conflicts, dependency issues).")
-        st.session_state.leveled_resource_schedule = {} # No valid complete schedule
-        for failed_id in unscheduled_task_ids:
-            if failed_id in task_map: task_map[failed_id]['status'] = "Pending (Leveling Error)"
+        leveled_resource_schedule = {} # No valid complete schedule
     else:
         logging.info("Resource leveling replan completed successfully for all tasks.")
-        st.success("Project dates recalculated successfully using resource leveling.")
-        # Store the detailed leveled schedule for workload visualization
-        st.session_state.leveled_resource_schedule = dict(resource_schedule_hours)
+        leveled_resource_schedule = build_leveled_resource_schedule(resource_schedule_matrix, project_start_date, schedule_role_names)
 
-    # Update the main session state tasks with the replanned tasks
-    final_replan_tasks = []
-    all_original_task_ids_in_session = [t_orig['id'] for t_orig in st.session_state.tasks]
+    return list(task_map.values()), unscheduled_task_ids, leveled_resource_schedule
 
-    for task_id_orig in all_original_task_ids_in_session:
-        if task_id_orig in task_map: # If the task was part of the replan (i.e., in tasks_to_plan)
-            final_replan_tasks.append(task_map[task_id_orig])
-        else: # Task was not in tasks_to_plan (e.g., if replan was selective, though current impl. is all)
-            original_task_obj = next((t for t in st.session_state.tasks if t['id'] == task_id_orig), None)
-            if original_task_obj:
-                final_replan_tasks.append(original_task_obj) # Keep original if not replanned
 
-    st.session_state.tasks = final_replan_tasks
+# --- JSON EXPORT FUNCTION ---
+def serialize_project_export(export_payload: dict) -> bytes:
+    """
+    Serializes the project export payload to indented JSON in a single pass.
+    Dates are written in ISO format; uses orjson when it is installed and the standard library otherwise.
+
+    Args:
+        export_payload: The project data (roles, tasks, next_task_id, config, phases).
+
+    Returns:
+        The UTF-8 encoded JSON document.
+    """
+    if orjson is not None:
+        return orjson.dumps(export_payload, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY, default=str)
+    return json.dumps(export_payload, indent=2, default=str).encode('utf-8')
 
 
 # --- EXCEL EXPORT FUNCTION ---
@@ -1287,7 +1974,8 @@ with tab_config:
                         'default': {"Monday": 9.0, "Tuesday": 9.0, "Wednesday": 9.0, "Thursday": 9.0, "Friday": 7.0, "Saturday": 0.0, "Sunday": 0.0},
                         'monthly_overrides': {}
                     },
-                    'profit_margin_percent': 0.0
+                    'profit_margin_percent': 0.0,
+                    'buffer_hours_per_day': 0.0
                 }
                 st.success("New empty project created successfully.")
                 del st.session_state.confirm_new_project # Clear confirmation flag
@@ -1328,7 +2016,6 @@ with tab_config:
 
     if config_changed_flag_settings:
         st.success("General project settings updated. Consider replanning if dates are affected.")
-        st.rerun() # Rerun to reflect changes immediately
     st.divider()
 
     st.subheader("👥 Role Management")
@@ -1343,7 +2030,6 @@ with tab_config:
                 if role_name_input.strip():
                     st.session_state.roles[role_name_input.strip()] = {"availability_percent": role_availability_input, "rate_eur_hr": role_rate_input}
                     st.success(f"Role '{role_name_input.strip()}' added/updated successfully.")
-                    st.rerun()
                 else:
                     st.error("Role name cannot be empty.")
 
@@ -1384,7 +2070,6 @@ with tab_config:
                     st.session_state.roles[row["Role"]]["rate_eur_hr"] = row["Rate (€/h)"]
                     st.session_state.roles[row["Role"]]["availability_percent"] = row["Availability (%)"]
                 st.success("Roles updated from table.")
-                st.rerun()
         else:
             st.info("No roles defined yet. Add roles using the form on the left.")
     st.divider()
@@ -1405,7 +2090,6 @@ with tab_config:
                     else:
                         st.session_state.phases[new_phase_name.strip()] = new_phase_color
                         st.success(f"Phase '{new_phase_name.strip()}' added.")
-                        st.rerun()
 
             st.write("**Delete Phase**")
             phase_to_delete = st.selectbox("Select Phase to Delete", [""] + sorted(list(st.session_state.phases.keys())), key="delete_phase_select")
@@ -1440,7 +2124,6 @@ with tab_config:
                     for i, task_item in enumerate(st.session_state.tasks):
                         st.session_state.tasks[i]['phase_color'] = st.session_state.phases.get(task_item['phase'], "#CCCCCC") # Default color
                     st.success("Phase colors updated from table.")
-                    st.rerun()
             else:
                 st.info("No phases defined yet.")
     st.divider()
@@ -1531,20 +2214,27 @@ with tab_config:
     st.divider()
 
     st.subheader("🔄 Recalculate Plan with Resource Leveling")
-    st.warning("This action re-schedules all tasks based on their ID priority, dependencies, and daily resource capacity (effort in Person-Hours). Existing task dates will be overwritten by the leveling algorithm.")
+    st.warning("This action re-schedules all tasks based on their dependencies, critical path priority (longest remaining chain first, then ID), and daily resource capacity (effort in Person-Hours). Existing task dates will be overwritten by the leveling algorithm.")
+    current_buffer_hours = float(st.session_state.config.get('buffer_hours_per_day', 0.0))
+    new_buffer_hours = st.number_input(
+        "Daily Buffer (hours)", 0.0, 24.0, value=current_buffer_hours, step=0.5, format="%.1f",
+        key="buffer_hours_per_day_input_main",
+        help="System working hours per day that leveling leaves unassigned, as slack for unplanned work. Applied on the next replan."
+    )
+    if new_buffer_hours != current_buffer_hours:
+        st.session_state.config['buffer_hours_per_day'] = new_buffer_hours
     if st.button("🔁 Replan with Resource Leveling", key="replan_leveled_effort_button_main"):
         if not st.session_state.tasks:
             st.info("No tasks in the project to replan.")
         elif not st.session_state.roles:
             st.error("No roles defined. Roles are required for resource leveling.")
         else:
-            # Create a deep copy of tasks for replanning to avoid modifying session state directly during calculation
-            tasks_copy_for_replan = [task.copy() for task in st.session_state.tasks]
+            # The leveler copies the tasks it reschedules, so session state is only replaced once it has finished
             logging.info("--- Starting Resource Leveling Replan (User Triggered) ---")
-            replan_with_resource_leveling(tasks_copy_for_replan, st.session_state.roles, st.session_state.config)
+            replan_with_resource_leveling(st.session_state.tasks, st.session_state.roles, st.session_state.config)
             # replan_with_resource_leveling modifies st.session_state.tasks internally if successful
             logging.info("--- Resource Leveling Replan Finished (User Triggered) ---")
-            st.rerun() # Rerun to show updated dates and statuses
+            # No st.rerun(): the data preparation and the other tabs run after this point and read the replanned tasks
     st.divider()
 
     st.subheader("📈 Profit Margin")
@@ -1556,7 +2246,6 @@ with tab_config:
     if new_profit_margin != current_profit_margin:
         st.session_state.config['profit_margin_percent'] = new_profit_margin
         st.success("Profit margin updated. Cost estimations will reflect this change.")
-        st.rerun() # Rerun to update cost displays
     st.divider()
 
     st.subheader("💾 Project Data Management")
@@ -1584,19 +2273,17 @@ with tab_config:
 
             export_data_payload["tasks"].append(task_copy_export)
 
-        # Prepare config for export (convert date to ISO format)
-        config_copy_export = json.loads(json.dumps(st.session_state.config, default=str)) # Deep copy and convert non-serializable
-        if 'project_start_date' in config_copy_export and isinstance(st.session_state.config['project_start_date'], datetime.date):
-            config_copy_export['project_start_date'] = st.session_state.config['project_start_date'].isoformat()
+        # Prepare config for export: a shallow copy is enough, dates are written in ISO format by serialize_project_export
+        config_copy_export = dict(st.session_state.config)
         # Ensure monthly override keys are strings for JSON export consistency
-        if 'working_hours' in config_copy_export and 'monthly_overrides' in config_copy_export['working_hours']:
-            config_copy_export['working_hours']['monthly_overrides'] = {
+        if isinstance(config_copy_export.get('working_hours'), dict) and 'monthly_overrides' in config_copy_export['working_hours']:
+            config_copy_export['working_hours'] = dict(config_copy_export['working_hours'], monthly_overrides={
                 str(k): v for k,v in config_copy_export['working_hours']['monthly_overrides'].items()
-            }
+            })
         export_data_payload["config"] = config_copy_export
 
         try:
-            json_export_string = json.dumps(export_data_payload, indent=2)
+            json_export_string = serialize_project_export(export_data_payload)
             st.download_button(
                 label="📥 Download Plan (JSON)",
                 data=json_export_string,
@@ -1623,9 +2310,11 @@ with tab_config:
                         if isinstance(task_data_imported.get('end_date'), str):
                             task_data_imported['end_date'] = datetime.date.fromisoformat(task_data_imported['end_date'])
 
-                        task_data_imported['effort_ph'] = float(task_data_imported.get('effort_ph', 0.0))
+                        # null (how orjson writes NaN) is read as a missing value
+                        task_data_imported['effort_ph'] = float(task_data_imported.get('effort_ph') if task_data_imported.get('effort_ph') is not None else 0.0)
                         # Handle potential old 'duration' key, prefer 'duration_calc_days'
-                        task_data_imported['duration_calc_days'] = float(task_data_imported.get('duration_calc_days', task_data_imported.get('duration', 0.0)))
+                        imported_duration = task_data_imported.get('duration_calc_days', task_data_imported.get('duration', 0.0))
+                        task_data_imported['duration_calc_days'] = float(imported_duration if imported_duration is not None else 0.0)
                         task_data_imported.pop('duration', None) # Remove old key if present
 
                         # Ensure assignments and dependencies are correctly parsed/formatted
@@ -1662,6 +2351,7 @@ with tab_config:
                     st.session_state.config.setdefault('project_start_date', datetime.date.today())
                     st.session_state.config.setdefault('exclude_weekends', True)
                     st.session_state.config.setdefault('profit_margin_percent', 0.0)
+                    st.session_state.config.setdefault('buffer_hours_per_day', 0.0)
 
                     # Post-import processing: update phase colors and recalculate durations if needed
                     for i, task_final_import in enumerate(st.session_state.tasks):
@@ -1687,76 +2377,139 @@ with tab_config:
 # This section prepares tasks_df which is used by multiple tabs for display.
 # It should use the most up-to-date configurations from st.session_state.config.
 
+@st.cache_data(ttl=3600, max_entries=8, show_spinner=False)
+def _prepare_tasks_display_frame(tasks_hash: str, roles_hash: str, config_hash: str, phases_hash: str, _tasks_list: list, _roles_config: dict, _project_config: dict, _phases_config: dict) -> tuple[pd.DataFrame, dict, dict, dict]:
+    """
+    Builds the task DataFrame shown by the other tabs (durations, end dates, parsed assignments, colors, costs
+    and their display strings) and the task options of the dependency and assignment selectors.
+    Cached on fingerprints of its inputs, so reruns that do not touch tasks or configuration skip the rebuild.
+
+    Args:
+        tasks_hash: Fingerprint of _tasks_list.
+        roles_hash: Fingerprint of _roles_config.
+        config_hash: Fingerprint of _project_config.
+        phases_hash: Fingerprint of _phases_config.
+        _tasks_list: The task dictionaries from session state (not modified).
+        _roles_config: Configuration of roles.
+        _project_config: General project configuration (working hours, weekends).
+        _phases_config: Phase name to color mapping.
+
+    Returns:
+        A tuple: (tasks_df_for_display, task_end_dates_map, dependency_options, assignment_task_options)
+        - task_end_dates_map (dict): Task ID to end date.
+        - dependency_options (dict): Task ID to its label in the dependency selector, ordered by start date.
+        - assignment_task_options (dict): Task ID to its label in the assignment task selector, ordered by start date.
+    """
+    tasks_list, roles_config, phases_config = _tasks_list, _roles_config, _phases_config
+    working_hours_config = _project_config['working_hours']
+    exclude_weekends = _project_config['exclude_weekends']
+
+    if tasks_list:
+        # pd.DataFrame copies the values out of the task dicts, so session state tasks are not modified here
+        tasks_df_for_display = pd.DataFrame(tasks_list)
+
+        tasks_df_for_display['effort_ph'] = pd.to_numeric(tasks_df_for_display['effort_ph'], errors='coerce').fillna(0.0)
+
+        # Boolean mask of the tasks with effort: only those rows go through the per-task calculations below
+        has_effort = (tasks_df_for_display['effort_ph'] > 0).to_numpy()
+
+        # Ensure duration_calc_days is calculated if missing or zero, using current configurations
+        duration_values = pd.to_numeric(tasks_df_for_display['duration_calc_days'], errors='coerce').to_numpy(dtype=float)
+        needs_duration = has_effort & ~(duration_values > 0) # Missing (NaN) or not positive
+        duration_values[needs_duration] = [
+            calculate_estimated_duration_from_effort(
+                effort_ph,
+                parse_assignments(assignments), # Ensure assignments are parsed
+                roles_config,
+                working_hours_config,
+                exclude_weekends
+            )
+            for effort_ph, assignments in zip(tasks_df_for_display['effort_ph'].to_numpy()[needs_duration], tasks_df_for_display['assignments'].to_numpy()[needs_duration])
+        ]
+        duration_values[~has_effort] = 0.5 # For tasks with no effort (e.g., milestones), assign a minimal duration
+        tasks_df_for_display['duration_calc_days'] = pd.Series(duration_values, index=tasks_df_for_display.index).fillna(0.5) # Fallback if still NaN
+
+        tasks_df_for_display['start_date'] = pd.to_datetime(tasks_df_for_display['start_date'], errors='coerce').dt.date
+
+        # Recalculate end_date if missing or if it needs to be based on effort (e.g., after leveling)
+        # The 'end_date' in session_state.tasks should be the one from leveling.
+        # This section primarily ensures it's a date object for display.
+        if 'end_date' not in tasks_df_for_display.columns or tasks_df_for_display['end_date'].isnull().any():
+            # One calendar shared by every row instead of a new one per task
+            valid_start_dates = [d for d in tasks_df_for_display['start_date'] if pd.notna(d) and isinstance(d, datetime.date)]
+            shared_working_calendar = WorkingCalendar(working_hours_config, exclude_weekends, min(valid_start_dates)) if valid_start_dates else None
+            tasks_df_for_display['end_date'] = [
+                calculate_end_date_from_effort(
+                    start_date, effort_ph,
+                    parse_assignments(assignments), roles_config,
+                    working_hours_config, exclude_weekends, shared_working_calendar)
+                if pd.notna(start_date) and task_has_effort and isinstance(start_date, datetime.date)
+                else (start_date if pd.notna(start_date) else pd.NaT) # For milestones, end = start
+                for start_date, effort_ph, task_has_effort, assignments in zip(
+                    tasks_df_for_display['start_date'], tasks_df_for_display['effort_ph'], has_effort, tasks_df_for_display['assignments']
+                )
+            ]
+        tasks_df_for_display['end_date'] = pd.to_datetime(tasks_df_for_display['end_date'], errors='coerce').dt.date
+
+        tasks_df_for_display['assignments'] = tasks_df_for_display['assignments'].apply(parse_assignments) # Ensure it's always a list of dicts
+        tasks_df_for_display['phase'] = tasks_df_for_display['phase'].fillna('No Phase').astype(str)
+        tasks_df_for_display['subtask'] = tasks_df_for_display['subtask'].fillna('No Subtask').astype(str)
+        tasks_df_for_display['name'] = tasks_df_for_display['phase'] + " - " + tasks_df_for_display['subtask']
+        tasks_df_for_display['phase_color'] = tasks_df_for_display['phase'].apply(lambda p: phases_config.get(p, "#CCCCCC"))
+        task_costs = np.zeros(len(tasks_df_for_display))
+        task_costs[has_effort] = [
+            calculate_task_cost_by_effort(effort_ph, assignments, roles_config)
+            for effort_ph, assignments in zip(tasks_df_for_display['effort_ph'].to_numpy()[has_effort], tasks_df_for_display['assignments'].to_numpy()[has_effort])
+        ]
+        tasks_df_for_display['cost'] = task_costs
+
+        # Display-friendly columns for the task editor, built here so unchanged reruns reuse them
+        display_task_index = build_task_index(tasks_list) # One index for all rows instead of a scan per dependency
+        tasks_df_for_display['assignments_display'] = [format_assignments_display(assignments) for assignments in tasks_df_for_display['assignments']]
+        tasks_df_for_display['dependencies_display'] = [format_dependencies_display(dependencies, tasks_list, display_task_index) for dependencies in tasks_df_for_display['dependencies']]
+        tasks_df_for_display['cost_display'] = "€ " + tasks_df_for_display['cost'].map("{:,.2f}".format)
+        tasks_df_for_display['end_date_display'] = pd.to_datetime(tasks_df_for_display['end_date'], errors='coerce').dt.strftime('%Y-%m-%d').fillna('N/A (Replan)')
+        # Create a map of task end dates for dependency calculations if needed by other parts (e.g., new task form)
+        valid_end_dates_for_map = tasks_df_for_display.dropna(subset=['id', 'end_date'])
+        task_end_dates_map = pd.Series(
+            valid_end_dates_for_map.end_date.values,
+            index=valid_end_dates_for_map.id
+        ).to_dict()
+    else: # No tasks in the project
+        tasks_df_for_display = pd.DataFrame(columns=[
+            'id', 'phase', 'subtask', 'phase_color', 'name', 'start_date',
+            'effort_ph', 'duration_calc_days', 'assignments', 'dependencies',
+            'status', 'notes', 'end_date', 'cost'
+        ])
+        task_end_dates_map = {}
+
+    # Both selectors list tasks by start date; sort once for the two option maps
+    tasks_by_start_date = sorted(tasks_list, key=lambda x_dep: x_dep.get('start_date', datetime.date.min))
+    dependency_options = {
+        task_dep['id']: f"{task_dep.get('name', f'ID {task_dep['id']}')} (ID: {task_dep['id']})"
+        for task_dep in tasks_by_start_date
+    }
+    assignment_task_options = {
+        task_assign_item['id']: f"{task_assign_item.get('name', 'Unnamed Task')} (Effort: {task_assign_item.get('effort_ph',0)} PH)"
+        for task_assign_item in tasks_by_start_date
+    }
+    return tasks_df_for_display, task_end_dates_map, dependency_options, assignment_task_options
+
 tasks_list_for_df_prep = st.session_state.tasks
 current_project_config_prep = st.session_state.config
 current_working_hours_prep = current_project_config_prep['working_hours']
-current_exclude_weekends_prep = current_project_config_prep['exclude_weekends']
 current_roles_prep = st.session_state.roles
 current_phases_prep = st.session_state.phases
 
-
-if tasks_list_for_df_prep:
-     # Create a fresh copy for DataFrame to avoid modifying session state tasks directly here
-     tasks_df_list_copy_prep = [t.copy() for t in tasks_list_for_df_prep]
-     tasks_df_for_display = pd.DataFrame(tasks_df_list_copy_prep)
-
-     tasks_df_for_display['effort_ph'] = pd.to_numeric(tasks_df_for_display['effort_ph'], errors='coerce').fillna(0.0)
-
-     # Ensure duration_calc_days is calculated if missing or zero, using current configurations
-     for index, row in tasks_df_for_display.iterrows():
-        if row['effort_ph'] > 0 and (pd.isna(row['duration_calc_days']) or row['duration_calc_days'] <=0):
-            tasks_df_for_display.loc[index, 'duration_calc_days'] = calculate_estimated_duration_from_effort(
-                row['effort_ph'],
-                parse_assignments(row['assignments']), # Ensure assignments are parsed
-                current_roles_prep,
-                current_working_hours_prep,
-                current_exclude_weekends_prep
-            )
-        elif row['effort_ph'] <= 0 : # For tasks with no effort (e.g., milestones)
-             tasks_df_for_display.loc[index, 'duration_calc_days'] = 0.5 # Assign a minimal duration
-
-     tasks_df_for_display['duration_calc_days'] = pd.to_numeric(tasks_df_for_display['duration_calc_days'], errors='coerce').fillna(0.5) # Fallback if still NaN
-
-     tasks_df_for_display['start_date'] = pd.to_datetime(tasks_df_for_display['start_date'], errors='coerce').dt.date
-
-     # Recalculate end_date if missing or if it needs to be based on effort (e.g., after leveling)
-     # The 'end_date' in session_state.tasks should be the one from leveling.
-     # This section primarily ensures it's a date object for display.
-     if 'end_date' not in tasks_df_for_display.columns or tasks_df_for_display['end_date'].isnull().any():
-         tasks_df_for_display['end_date'] = tasks_df_for_display.apply(
-             lambda row: calculate_end_date_from_effort(
-                             row['start_date'], row['effort_ph'],
-                             parse_assignments(row['assignments']), current_roles_prep,
-                             current_working_hours_prep, current_exclude_weekends_prep)
-                         if pd.notna(row['start_date']) and row['effort_ph'] > 0 and isinstance(row['start_date'], datetime.date)
-                         else (row['start_date'] if pd.notna(row['start_date']) else pd.NaT), # For milestones, end = start
-             axis=1
-         )
-     tasks_df_for_display['end_date'] = pd.to_datetime(tasks_df_for_display['end_date'], errors='coerce').dt.date
-
-     tasks_df_for_display['assignments'] = tasks_df_for_display['assignments'].apply(parse_assignments) # Ensure it's always a list of dicts
-     tasks_df_for_display['phase'] = tasks_df_for_display['phase'].fillna('No Phase').astype(str)
-     tasks_df_for_display['subtask'] = tasks_df_for_display['subtask'].fillna('No Subtask').astype(str)
-     tasks_df_for_display['name'] = tasks_df_for_display['phase'] + " - " + tasks_df_for_display['subtask']
-     tasks_df_for_display['phase_color'] = tasks_df_for_display['phase'].apply(lambda p: current_phases_prep.get(p, "#CCCCCC"))
-     tasks_df_for_display['cost'] = tasks_df_for_display.apply(
-         lambda row: calculate_task_cost_by_effort(row['effort_ph'], row['assignments'], current_roles_prep)
-                     if row['effort_ph'] > 0 else 0.0,
-         axis=1
-     )
-     # Create a map of task end dates for dependency calculations if needed by other parts (e.g., new task form)
-     valid_end_dates_for_map_prep = tasks_df_for_display.dropna(subset=['id', 'end_date'])
-     task_end_dates_map_for_new_task_form = pd.Series(
-         valid_end_dates_for_map_prep.end_date.values,
-         index=valid_end_dates_for_map_prep.id
-     ).to_dict()
-else: # No tasks in the project
-     tasks_df_for_display = pd.DataFrame(columns=[
-         'id', 'phase', 'subtask', 'phase_color', 'name', 'start_date',
-         'effort_ph', 'duration_calc_days', 'assignments', 'dependencies',
-         'status', 'notes', 'end_date', 'cost'
-     ])
-     task_end_dates_map_for_new_task_form = {}
+# Content hashes of the prep inputs; also key the caches of the tab derivations built from tasks_df_for_display
+display_frame_input_hashes = (
+    fingerprint_for_cache(tasks_list_for_df_prep), fingerprint_for_cache(current_roles_prep),
+    fingerprint_for_cache(current_project_config_prep), fingerprint_for_cache(current_phases_prep),
+)
+tasks_df_for_display, task_end_dates_map_for_new_task_form, dep_options_for_new_task, task_options_for_assignment_edit = _prepare_tasks_display_frame(
+    *display_frame_input_hashes,
+    tasks_list_for_df_prep, current_roles_prep, current_project_config_prep, current_phases_prep
+)
 
 
 # --- Tasks Tab (Editing and Creation) ---
@@ -1808,11 +2561,7 @@ with tab_tasks:
                 value=default_new_task_start_date, key="new_task_start_date_manual"
             )
 
-            # Dependencies
-            dep_options_for_new_task = {
-                task_dep['id']: f"{task_dep.get('name', f'ID {task_dep['id']}')} (ID: {task_dep['id']})"
-                for task_dep in sorted(st.session_state.tasks, key=lambda x_dep: x_dep.get('start_date', datetime.date.min))
-            }
+            # Dependencies (options ordered by start date, prepared in the common data prep section)
             task_dependencies_ids_selected = st.multiselect(
                 "Dependencies (Prerequisite Tasks)",
                 options=list(dep_options_for_new_task.keys()),
@@ -1856,6 +2605,11 @@ with tab_tasks:
 
                     # Calculate start date considering dependencies
                     calculated_start_date_for_new_task = task_start_date_manual_input
+                    # One calendar for all the working day lookups of this submission
+                    new_task_working_calendar = WorkingCalendar(
+                        st.session_state.config['working_hours'], st.session_state.config['exclude_weekends'],
+                        min(task_start_date_manual_input, default_new_task_start_date)
+                    )
                     if task_dependencies_ids_selected:
                         # task_end_dates_map_for_new_task_form is prepared in the common data prep section
                         computed_start_from_deps = calculate_dependent_start_date_for_scheduling(
@@ -1863,14 +2617,15 @@ with tab_tasks:
                             task_end_dates_map_for_new_task_form, # Use the map from common prep
                             default_new_task_start_date, # Project default start
                             st.session_state.config['working_hours'],
-                            st.session_state.config['exclude_weekends']
+                            st.session_state.config['exclude_weekends'],
+                            new_task_working_calendar
                         )
                         if computed_start_from_deps:
                             calculated_start_date_for_new_task = computed_start_from_deps
                         else: # Should not happen if map is correct, but as a fallback:
-                            calculated_start_date_for_new_task = get_next_working_day(task_start_date_manual_input, st.session_state.config['working_hours'], st.session_state.config['exclude_weekends'])
+                            calculated_start_date_for_new_task = get_next_working_day(task_start_date_manual_input, st.session_state.config['working_hours'], st.session_state.config['exclude_weekends'], new_task_working_calendar)
                     else: # No dependencies, ensure it's a working day
-                        calculated_start_date_for_new_task = get_next_working_day(task_start_date_manual_input, st.session_state.config['working_hours'], st.session_state.config['exclude_weekends'])
+                        calculated_start_date_for_new_task = get_next_working_day(task_start_date_manual_input, st.session_state.config['working_hours'], st.session_state.config['exclude_weekends'], new_task_working_calendar)
 
                     new_task_id_val = st.session_state.next_task_id
                     st.session_state.next_task_id += 1
@@ -1914,7 +2669,8 @@ with tab_tasks:
                              new_task_entry_dict['end_date'] = calculate_end_date_from_effort(
                                  new_task_entry_dict['start_date'], new_task_entry_dict['effort_ph'],
                                  new_task_entry_dict['assignments'], st.session_state.roles,
-                                 st.session_state.config['working_hours'], st.session_state.config['exclude_weekends']
+                                 st.session_state.config['working_hours'], st.session_state.config['exclude_weekends'],
+                                 new_task_working_calendar
                              )
                         else: # Milestone like (0 effort)
                              new_task_entry_dict['end_date'] = new_task_entry_dict['start_date']
@@ -1929,13 +2685,8 @@ with tab_tasks:
     st.caption("You can edit Phase, Subtask, Start Date, Effort (PH), Dependencies (as JSON list of IDs), Status, and Notes directly in the table. Estimated Duration and Calculated End Date/Cost are re-evaluated. For a resource-aware schedule, use the 'Replan with Resource Leveling' button in Settings.")
 
     if not tasks_df_for_display.empty:
-        tasks_df_editor_display = tasks_df_for_display.copy() # Use the prepared DataFrame
-
-        # Add display-friendly columns for assignments and dependencies
-        tasks_df_editor_display['assignments_display'] = tasks_df_editor_display['assignments'].apply(format_assignments_display)
-        tasks_df_editor_display['dependencies_display'] = tasks_df_editor_display['dependencies'].apply(lambda d_str: format_dependencies_display(d_str, st.session_state.tasks)) # Pass full task list for name lookup
-        tasks_df_editor_display['cost_display'] = tasks_df_editor_display['cost'].apply(lambda c_val: f"€ {c_val:,.2f}")
-        tasks_df_editor_display['end_date_display'] = tasks_df_editor_display['end_date'].apply(lambda d_val: d_val.strftime('%Y-%m-%d') if pd.notna(d_val) and isinstance(d_val, datetime.date) else 'N/A (Replan)')
+        # Use the prepared DataFrame; its display-friendly columns (assignments, dependencies, cost, end date) are built in the common prep
+        tasks_df_editor_display = tasks_df_for_display.copy()
 
 
         column_config_for_task_editor = {
@@ -1972,7 +2723,15 @@ with tab_tasks:
         )
 
         # Process changes from the data_editor
-        if edited_df_from_table is not None: # Check if editor returned data
+        # Fingerprint of the editor output and the task list: when both match the last pass that saved nothing,
+        # reconciling again would save nothing either (reruns from unrelated widgets), so the row loop is skipped
+        task_editor_pass_fingerprint = None
+        if edited_df_from_table is not None:
+            task_editor_pass_fingerprint = hashlib.blake2b(
+                pd.util.hash_pandas_object(edited_df_from_table, index=False).to_numpy().tobytes() + display_frame_input_hashes[0].encode('utf-8'),
+                digest_size=16
+            ).hexdigest()
+        if edited_df_from_table is not None and task_editor_pass_fingerprint != st.session_state.get('task_editor_unchanged_fingerprint'): # Check if editor returned data
             try:
                 updated_tasks_list_from_editor = []
                 processed_ids_from_editor = set()
@@ -1980,7 +2739,16 @@ with tab_tasks:
 
                 original_tasks_map_for_edit = {task_orig['id']: task_orig for task_orig in st.session_state.tasks}
 
-                for i_row_edit, edited_row in edited_df_from_table.iterrows():
+                # Start dates converted in one vectorized call instead of one pd.to_datetime per row
+                converted_start_dates_from_table = pd.to_datetime(edited_df_from_table['start_date'], errors='coerce').dt.date.tolist()
+                # One calendar for the end date of every row (extended on demand for later dates)
+                editor_working_calendar = WorkingCalendar(
+                    st.session_state.config['working_hours'], st.session_state.config['exclude_weekends'],
+                    min([start_date for start_date in converted_start_dates_from_table if pd.notna(start_date)], default=datetime.date.today()) # NaT is also a date instance
+                )
+
+                # Rows as plain dicts: .get() is a dict lookup instead of building a pandas Series per row
+                for edited_row, converted_start_date in zip(edited_df_from_table.to_dict('records'), converted_start_dates_from_table):
                     task_id_edited = edited_row.get('id')
                     is_new_row_from_editor = pd.isna(task_id_edited) or task_id_edited <= 0 # Check if it's a new row added via editor UI
 
@@ -2025,7 +2793,7 @@ with tab_tasks:
                     edited_full_name = f"{edited_phase_name} - {edited_subtask_name}"
                     edited_phase_color = st.session_state.phases.get(edited_phase_name, current_phase_color_for_row)
 
-                    edited_start_date = pd.to_datetime(edited_row.get('start_date'), errors='coerce').date() \
+                    edited_start_date = converted_start_date \
                                         if pd.notna(edited_row.get('start_date')) \
                                         else (original_task_data_for_row.get('start_date') or datetime.date.today())
 
@@ -2053,7 +2821,7 @@ with tab_tasks:
                             recalculated_end_date = calculate_end_date_from_effort(
                                 edited_start_date, edited_effort_ph, current_assignments_for_row,
                                 st.session_state.roles, st.session_state.config['working_hours'],
-                                st.session_state.config['exclude_weekends']
+                                st.session_state.config['exclude_weekends'], editor_working_calendar
                             )
                         else: # Milestone
                             recalculated_end_date = edited_start_date
@@ -2105,12 +2873,11 @@ with tab_tasks:
 
                 if deleted_ids_by_editor:
                     needs_rerun_after_edit = True
-                    # Filter out tasks that were deleted
-                    final_task_list_after_editor = [t for t in updated_tasks_list_from_editor if t['id'] not in deleted_ids_by_editor]
+                    # Deleted tasks are exactly the ids missing from the updated list, so it needs no filtering pass
                     deleted_task_names = [original_tasks_map_for_edit.get(del_id,{}).get('name',f'ID {del_id}') for del_id in deleted_ids_by_editor]
                     st.success(f"Tasks deleted via table: {', '.join(deleted_task_names)}.")
 
-                    # Update dependencies in remaining tasks if any deleted tasks were dependencies
+                    # Update dependencies in remaining tasks if any deleted tasks were dependencies (single pass over the survivors)
                     dependency_updates_log = []
                     for task_in_final_list in final_task_list_after_editor:
                         current_deps_of_task = parse_dependencies(task_in_final_list.get('dependencies','[]'))
@@ -2124,11 +2891,13 @@ with tab_tasks:
                 # Only update session state and rerun if there were actual changes
                 if needs_rerun_after_edit:
                     # Check if the content actually changed to avoid unnecessary reruns if only formatting was touched
-                    # A more robust check would be a deep comparison, but string comparison of JSON is often sufficient
-                    if json.dumps(st.session_state.tasks, sort_keys=True, default=str) != json.dumps(final_task_list_after_editor, sort_keys=True, default=str):
+                    # Deep comparison of the task dicts; stops at the first difference instead of serializing both lists
+                    if st.session_state.tasks != final_task_list_after_editor:
                         st.session_state.tasks = final_task_list_after_editor
                         st.success("Task list changes saved from table.")
                         st.rerun()
+                # Nothing was saved (a save reruns the script above), so remember this pass
+                st.session_state.task_editor_unchanged_fingerprint = task_editor_pass_fingerprint
             except Exception as e_editor_processing:
                 st.error(f"Error processing changes from task table: {e_editor_processing}")
                 logging.error(f"Task table editor error: {e_editor_processing}", exc_info=True)
@@ -2143,11 +2912,7 @@ with tab_tasks:
     elif not st.session_state.roles:
         st.warning("No roles defined in Settings. Roles are needed for assignments.")
     else:
-        # Prepare options for task selection dropdown
-        task_options_for_assignment_edit = {
-            task_assign_item['id']: f"{task_assign_item.get('name', 'Unnamed Task')} (Effort: {task_assign_item.get('effort_ph',0)} PH)"
-            for task_assign_item in sorted(st.session_state.tasks, key=lambda x_assign: x_assign.get('start_date', datetime.date.min))
-        }
+        # Options for task selection dropdown (task_options_for_assignment_edit) come from the common prep, sorted by start date
         selected_task_id_for_assignment = st.selectbox(
             "Select Task to Edit Assignments:",
             options=[None] + list(task_options_for_assignment_edit.keys()), # Allow None to be selected
@@ -2220,6 +2985,99 @@ with tab_tasks:
                 st.error(f"Task with ID {selected_task_id_for_assignment} not found. This is unexpected.")
 
 # --- Gantt Tab ---
+@st.cache_resource(ttl=3600, max_entries=8, show_spinner=False)
+def _build_gantt_figure(tasks_hash: str, roles_hash: str, config_hash: str, phases_hash: str, _tasks_df: pd.DataFrame, _project_config: dict) -> go.Figure | None:
+    """
+    Builds the Gantt chart figure (one bar per working-day segment of each task) from the prepared task DataFrame.
+
+    Cached on the same fingerprints as _prepare_tasks_display_frame, whose output it is built from, so reruns
+    that do not touch tasks or configuration skip the segment join and the plotly figure build. Cached as a
+    resource (the figure object itself, not a pickled copy): st.plotly_chart only reads it via to_dict(), so it is never modified.
+
+    Args:
+        tasks_hash: Fingerprint of the task list behind _tasks_df.
+        roles_hash: Fingerprint of the roles configuration behind _tasks_df.
+        config_hash: Fingerprint of _project_config.
+        phases_hash: Fingerprint of the phases configuration behind _tasks_df.
+        _tasks_df: The prepared task DataFrame (tasks_df_for_display, not modified).
+        _project_config: The project configuration (working hours, weekend rule and project start date).
+
+    Returns:
+        The plotly figure, or None if no task spans a working day.
+    """
+    tasks_df, project_config = _tasks_df, _project_config
+    gantt_df_source = tasks_df.copy() # Use the prepared DataFrame
+
+    # Prepare display columns for hover data
+    gantt_df_source['effort_ph_display'] = gantt_df_source['effort_ph'].apply(lambda x: f"{x:.1f} PH")
+    gantt_df_source['duration_actual_display'] = gantt_df_source.apply(
+        lambda r: f"{(r['end_date'] - r['start_date']).days + 1 if pd.notna(r['start_date']) and pd.notna(r['end_date']) and isinstance(r['start_date'], datetime.date) and isinstance(r['end_date'], datetime.date) and r['end_date'] >= r['start_date'] else r['duration_calc_days']:.1f} d",
+        axis=1
+    )
+    # Assignment and dependency names are already formatted by the common prep (one id index for all rows)
+    gantt_df_source['assignments_display_gantt'] = gantt_df_source['assignments_display']
+    gantt_df_source['dependencies_display_gantt'] = gantt_df_source['dependencies_display']
+
+    # Get phase colors for the Gantt chart
+    phase_colors_for_gantt = gantt_df_source.set_index('phase')['phase_color'].to_dict()
+
+    gantt_working_hours_config = project_config['working_hours']
+    gantt_exclude_weekends_config = project_config['exclude_weekends']
+    gantt_working_calendar = WorkingCalendar(gantt_working_hours_config, gantt_exclude_weekends_config, project_config['project_start_date'])
+
+    # Segments of all tasks in one DataFrame built from arrays; task columns are joined back once
+    gantt_segment_dates_df = get_working_segments_for_tasks(
+        gantt_df_source['id'].tolist(), gantt_df_source['start_date'].tolist(), gantt_df_source['end_date'].tolist(), gantt_working_calendar
+    )
+
+    if gantt_segment_dates_df.empty:
+        return None
+
+    # Single join back to the task columns instead of copying every column per segment
+    gantt_segments_df = gantt_segment_dates_df.merge(gantt_df_source, on='id', how='left')
+
+    # Sort by original task start date then by segment start for consistent Y-axis order
+    gantt_segments_df = gantt_segments_df.sort_values(by=['start_date', 'plotly_segment_start'])
+
+    fig_gantt_chart = px.timeline(
+        gantt_segments_df,
+        x_start="plotly_segment_start",
+        x_end="plotly_segment_end",
+        y="name", # Task name on Y-axis
+        color="phase", # Color by phase
+        color_discrete_map=phase_colors_for_gantt,
+        title="Project Timeline",
+        hover_name="name", # Show task name prominently on hover
+        hover_data={ # Customize hover data
+            "start_date": "|%Y-%m-%d", # Show original task start date
+            "end_date": "|%Y-%m-%d",   # Show original task end date
+            "effort_ph_display": True,
+            "duration_actual_display": True, # Show calculated duration
+            "assignments_display_gantt": True,
+            "dependencies_display_gantt": True,
+            "status": True,
+            "cost": ":.2f€", # Format cost
+            "notes": True,
+            # Hide internal plotly segment dates from hover
+            "plotly_segment_start": False,
+            "plotly_segment_end": False,
+            "phase": False, # Already shown by color legend
+            "phase_color": False,
+            "assignments": False, # Show formatted display version
+            "dependencies": False # Show formatted display version
+        },
+        custom_data=["id"] # Can be used for callbacks if needed
+    )
+    fig_gantt_chart.update_layout(
+        xaxis_title="Date",
+        yaxis_title="Tasks",
+        legend_title_text="Phase",
+        yaxis=dict(autorange="reversed", tickfont=dict(size=10)), # Show tasks top-to-bottom
+        xaxis=dict(type='date', tickformat="%d-%b\n%Y"), # Date format on X-axis
+        title_x=0.5 # Center title
+    )
+    return fig_gantt_chart
+
 with tab_gantt:
     st.header("📊 Interactive Gantt Chart")
     st.caption("This Gantt chart visualizes tasks based on their current start and end dates. For resource-leveled dates, ensure you've used 'Replan with Resource Leveling'.")
@@ -2230,89 +3088,10 @@ with tab_gantt:
        tasks_df_for_display['start_date'].notna().all() and \
        tasks_df_for_display['end_date'].notna().all():
 
-        gantt_df_source = tasks_df_for_display.copy() # Use the prepared DataFrame
+        fig_gantt_chart = _build_gantt_figure(*display_frame_input_hashes, tasks_df_for_display, current_project_config_prep)
 
-        # Prepare display columns for hover data
-        gantt_df_source['effort_ph_display'] = gantt_df_source['effort_ph'].apply(lambda x: f"{x:.1f} PH")
-        gantt_df_source['duration_actual_display'] = gantt_df_source.apply(
-            lambda r: f"{(r['end_date'] - r['start_date']).days + 1 if pd.notna(r['start_date']) and pd.notna(r['end_date']) and isinstance(r['start_date'], datetime.date) and isinstance(r['end_date'], datetime.date) and r['end_date'] >= r['start_date'] else r['duration_calc_days']:.1f} d",
-            axis=1
-        )
-        gantt_df_source['assignments_display_gantt'] = gantt_df_source['assignments'].apply(format_assignments_display)
-        gantt_df_source['dependencies_display_gantt'] = gantt_df_source['dependencies'].apply(lambda d_str: format_dependencies_display(d_str, st.session_state.tasks))
-
-        # Get phase colors for the Gantt chart
-        phase_colors_for_gantt = gantt_df_source.set_index('phase')['phase_color'].to_dict()
-
-        plotly_data_for_gantt_segments = []
-        gantt_working_hours_config = st.session_state.config['working_hours']
-        gantt_exclude_weekends_config = st.session_state.config['exclude_weekends']
-
-        for _, task_row_gantt in gantt_df_source.iterrows():
-             task_start = task_row_gantt['start_date']
-             task_end = task_row_gantt['end_date']
-
-             if isinstance(task_start, datetime.date) and isinstance(task_end, datetime.date) and task_start <= task_end:
-                 # Get working segments for this task
-                 working_segments_for_task = get_working_segments_from_dates(
-                     task_start, task_end, gantt_exclude_weekends_config, gantt_working_hours_config
-                 )
-                 for segment_start_date, segment_end_date in working_segments_for_task:
-                      # Plotly timeline x_end is exclusive, so add 1 day to the segment_end_date
-                      plotly_segment_end_date = segment_end_date + datetime.timedelta(days=1)
-                      task_data_for_segment = task_row_gantt.to_dict() # Copy all task data
-                      task_data_for_segment['plotly_segment_start'] = segment_start_date
-                      task_data_for_segment['plotly_segment_end'] = plotly_segment_end_date
-                      plotly_data_for_gantt_segments.append(task_data_for_segment)
-
-        if plotly_data_for_gantt_segments:
-             gantt_segments_df = pd.DataFrame(plotly_data_for_gantt_segments)
-             # Ensure dates are datetime objects for Plotly
-             gantt_segments_df['plotly_segment_start'] = pd.to_datetime(gantt_segments_df['plotly_segment_start'])
-             gantt_segments_df['plotly_segment_end'] = pd.to_datetime(gantt_segments_df['plotly_segment_end'])
-
-             # Sort by original task start date then by segment start for consistent Y-axis order
-             gantt_segments_df = gantt_segments_df.sort_values(by=['start_date', 'plotly_segment_start'])
-
-
-             fig_gantt_chart = px.timeline(
-                 gantt_segments_df,
-                 x_start="plotly_segment_start",
-                 x_end="plotly_segment_end",
-                 y="name", # Task name on Y-axis
-                 color="phase", # Color by phase
-                 color_discrete_map=phase_colors_for_gantt,
-                 title="Project Timeline",
-                 hover_name="name", # Show task name prominently on hover
-                 hover_data={ # Customize hover data
-                     "start_date": "|%Y-%m-%d", # Show original task start date
-                     "end_date": "|%Y-%m-%d",   # Show original task end date
-                     "effort_ph_display": True,
-                     "duration_actual_display": True, # Show calculated duration
-                     "assignments_display_gantt": True,
-                     "dependencies_display_gantt": True,
-                     "status": True,
-                     "cost": ":.2f€", # Format cost
-                     "notes": True,
-                     # Hide internal plotly segment dates from hover
-                     "plotly_segment_start": False,
-                     "plotly_segment_end": False,
-                     "phase": False, # Already shown by color legend
-                     "phase_color": False,
-                     "assignments": False, # Show formatted display version
-                     "dependencies": False # Show formatted display version
-                 },
-                 custom_data=["id"] # Can be used for callbacks if needed
-             )
-             fig_gantt_chart.update_layout(
-                 xaxis_title="Date",
-                 yaxis_title="Tasks",
-                 legend_title_text="Phase",
-                 yaxis=dict(autorange="reversed", tickfont=dict(size=10)), # Show tasks top-to-bottom
-                 xaxis=dict(type='date', tickformat="%d-%b\n%Y"), # Date format on X-axis
-                 title_x=0.5 # Center title
-             )
-             st.plotly_chart(fig_gantt_chart, use_container_width=True)
+        if fig_gantt_chart is not None:
+            st.plotly_chart(fig_gantt_chart, use_container_width=True)
         else:
             st.info("No valid task segments found for Gantt chart. Ensure tasks are scheduled with valid start/end dates and that these dates span at least one working day according to the calendar settings.")
     elif not tasks_df_for_display.empty:
@@ -2326,54 +3105,9 @@ with tab_deps:
     st.header("🔗 Dependency Visualization (Graph)")
     if not tasks_df_for_display.empty:
         try:
-            dep_graph = graphviz.Digraph(comment='Project Dependency Diagram')
-            dep_graph.attr(rankdir='LR') # Left-to-Right layout
-
             tasks_for_graph_list = st.session_state.tasks # Use direct session state for most current data
-            status_colors_for_graph = {
-                "Pending": "lightblue", "In Progress": "orange", "Completed": "lightgreen",
-                "Blocked": "lightcoral", "Pending (Leveling Error)": "pink",
-                "Pending (Dependency Error)": "lightgrey", "Pending (Leveled)": "lightyellow"
-            }
-            valid_task_ids_for_graph = {task_graph_node['id'] for task_graph_node in tasks_for_graph_list}
-
-            for task_node_item in tasks_for_graph_list:
-                assign_display_for_graph = format_assignments_display(task_node_item.get('assignments', []))
-
-                # Determine duration display for graph node
-                duration_display_for_graph = f"{task_node_item.get('duration_calc_days', '?'):.1f}d (est)" # Default to estimated
-                if 'end_date' in task_node_item and isinstance(task_node_item.get('start_date'), datetime.date) and isinstance(task_node_item.get('end_date'), datetime.date) and task_node_item['end_date'] >= task_node_item['start_date']:
-                    actual_duration_val = (task_node_item['end_date'] - task_node_item['start_date']).days + 1
-                    duration_display_for_graph = f"{actual_duration_val}d (sched)" # Leveled/Scheduled duration
-
-                node_label_html = f'''<{task_node_item.get('name', 'Unknown Task Name')}<BR/>
-                                    <FONT POINT-SIZE="10">
-                                    ID: {task_node_item.get('id', '?')}<BR/>
-                                    Effort: {task_node_item.get('effort_ph', '?')} PH | Dur: {duration_display_for_graph}<BR/>
-                                    Status: {task_node_item.get('status', 'N/A')}<BR/>
-                                    Assignments: {assign_display_for_graph}
-                                    </FONT>>'''
-                node_fill_color = status_colors_for_graph.get(task_node_item.get('status', 'Pending'), 'lightgrey') # Default color
-                dep_graph.node(
-                    str(task_node_item['id']),
-                    label=node_label_html,
-                    shape='box',
-                    style='filled',
-                    fillcolor=node_fill_color
-                )
-
-            # Add edges for dependencies
-            for task_edge_item in tasks_for_graph_list:
-                dependencies_for_edges = parse_dependencies(task_edge_item.get('dependencies', '[]'))
-                for dep_id_edge in dependencies_for_edges:
-                    if dep_id_edge in valid_task_ids_for_graph: # Ensure dependency exists as a node
-                        dep_graph.edge(str(dep_id_edge), str(task_edge_item['id']))
-
-            st.graphviz_chart(dep_graph, use_container_width=True)
-        except ImportError:
-            st.error("The 'graphviz' library is not installed or not configured correctly on your system. Please install it to use this feature.")
-            st.code("pip install graphviz")
-            st.info("You also need to install Graphviz system-wide. Download from: https://graphviz.org/download/")
+            dependency_graph_dot_source = build_dependency_graph_dot(tasks_for_graph_list)
+            st.graphviz_chart(dependency_graph_dot_source, use_container_width=True)
         except Exception as e_dep_graph:
             st.error(f"An error occurred while generating the dependency graph: {e_dep_graph}")
             logging.error(f"Dependency graph generation error: {e_dep_graph}", exc_info=True)
@@ -2400,69 +3134,24 @@ with tab_resources:
            project_min_date_overall <= project_max_date_overall:
 
             leveled_schedule_data_res = st.session_state.get('leveled_resource_schedule', {})
-            workload_data_for_chart = []
+            load_df_for_charting = None
 
             if leveled_schedule_data_res:
                 st.info("Displaying workload from the last resource leveling calculation.")
-                for date_val_dt_obj, roles_load_on_date in leveled_schedule_data_res.items():
-                    # Ensure date_val_dt_obj is a datetime.date object
-                    current_date_for_load_chart = None
-                    if isinstance(date_val_dt_obj, str):
-                        try: current_date_for_load_chart = datetime.date.fromisoformat(date_val_dt_obj)
-                        except ValueError: pass
-                    elif isinstance(date_val_dt_obj, datetime.datetime):
-                         current_date_for_load_chart = date_val_dt_obj.date()
-                    elif isinstance(date_val_dt_obj, datetime.date):
-                         current_date_for_load_chart = date_val_dt_obj
-                    else:
-                        logging.warning(f"Skipping unknown date format in leveled_resource_schedule: {date_val_dt_obj}")
-                        continue
-
-                    if current_date_for_load_chart:
-                        for role_name_load, hours_loaded in roles_load_on_date.items():
-                            workload_data_for_chart.append({'Date': pd.to_datetime(current_date_for_load_chart), 'Role': role_name_load, 'Load (h)': hours_loaded})
+                # Rows come straight from the leveled schedule matrix (one per day and role with hours)
+                load_df_for_charting = leveled_schedule_to_frame(leveled_schedule_data_res)
             else: # Fallback if no leveled schedule data
                 st.warning("No detailed leveled schedule data found from 'Replan with Resource Leveling'. Displaying an approximation of daily load. For accurate data, please run the replanning process from the Settings tab.")
-                # Fallback approximation logic (less accurate)
-                for _, task_res_approx_row in tasks_df_for_display.iterrows():
-                    task_start_approx_date = task_res_approx_row['start_date']
-                    task_end_approx_date = task_res_approx_row['end_date']
-                    assignments_approx_list = parse_assignments(task_res_approx_row.get('assignments',[]))
-                    task_effort_approx_val = task_res_approx_row.get('effort_ph', 0.0)
-
-                    if isinstance(task_start_approx_date, datetime.date) and isinstance(task_end_approx_date, datetime.date) and \
-                       task_start_approx_date <= task_end_approx_date and assignments_approx_list and task_effort_approx_val > 0:
-
-                        task_actual_working_days_count = 0
-                        temp_date_for_day_count = task_start_approx_date
-                        while temp_date_for_day_count <= task_end_approx_date:
-                            if get_working_hours_for_date(temp_date_for_day_count, current_working_hours_prep) > 0:
-                               task_actual_working_days_count +=1
-                            temp_date_for_day_count += datetime.timedelta(days=1)
-
-                        if task_actual_working_days_count == 0: continue # Avoid division by zero
-
-                        avg_effort_per_actual_working_day_for_task = task_effort_approx_val / task_actual_working_days_count
-
-                        current_d_approx_loop_date = task_start_approx_date
-                        while current_d_approx_loop_date <= task_end_approx_date:
-                            if get_working_hours_for_date(current_d_approx_loop_date, current_working_hours_prep) > 0: # Only consider working days
-                                for assign_approx_loop_item in assignments_approx_list:
-                                    role_approx_loop_name = assign_approx_loop_item['role']
-                                    alloc_approx_loop_pct_val = assign_approx_loop_item.get('allocation', 0) / 100.0
-
-                                    # Distribute the task's average daily effort based on role's allocation to *this task*
-                                    # This is a rough approximation.
-                                    role_share_effort_approx_today = avg_effort_per_actual_working_day_for_task * alloc_approx_loop_pct_val
-
-                                    workload_data_for_chart.append({'Date': pd.to_datetime(current_d_approx_loop_date), 'Role': role_approx_loop_name, 'Load (h)': role_share_effort_approx_today})
-                            current_d_approx_loop_date += datetime.timedelta(days=1)
-
-            if workload_data_for_chart:
-                load_df_for_charting = pd.DataFrame(workload_data_for_chart)
-                # Group by Date and Role, summing up hours if a role works on multiple tasks on the same day
-                load_summary_for_charting = load_df_for_charting.groupby(['Date', 'Role'])['Load (h)'].sum().reset_index()
-                load_summary_for_charting = load_summary_for_charting.sort_values(by=['Date', 'Role'])
+                # Fallback approximation logic (less accurate), built from calendar arrays instead of day-by-day loops
+                load_df_for_charting = approximate_daily_role_load_frame(tasks_df_for_display, current_working_hours_prep)
+
+            if load_df_for_charting is not None and not load_df_for_charting.empty:
+                # Roles as an ordered categorical: grouping works on integer codes instead of hashing strings
+                roles_for_load_categories = sorted(set(st.session_state.roles.keys()) | set(load_df_for_charting['Role'].unique()))
+                load_df_for_charting['Role'] = pd.Categorical(load_df_for_charting['Role'], categories=roles_for_load_categories, ordered=True)
+                # Group by Date and Role, summing up hours if a role works on multiple tasks on the same day.
+                # The groupby result is already ordered by Date then Role, so no extra sort_values pass is needed.
+                load_summary_for_charting = load_df_for_charting.groupby(['Date', 'Role'], observed=True)['Load (h)'].sum().reset_index()
 
                 st.subheader("📈 Daily Workload vs Capacity per Role")
                 all_roles_for_chart_select = sorted(list(st.session_state.roles.keys()))
@@ -2477,19 +3166,18 @@ with tab_resources:
 
                     # Calculate capacity line for the selected role over the project duration
                     dates_range_for_capacity_chart = pd.date_range(project_min_date_overall, project_max_date_overall, freq='D')
-                    role_capacity_data_for_chart = []
                     selected_role_info = st.session_state.roles.get(selected_role_for_chart, {})
                     role_availability_percent = selected_role_info.get('availability_percent', 100.0)
 
-                    for date_in_range_cap in dates_range_for_capacity_chart:
-                        date_obj_for_cap_calc = date_in_range_cap.date() # Convert pandas Timestamp to datetime.date
-                        daily_system_hours_for_cap = get_working_hours_for_date(date_obj_for_cap_calc, current_working_hours_prep)
-
-                        # Role's capacity for the day = system working hours * role's general availability %
-                        role_capacity_on_day = daily_system_hours_for_cap * (role_availability_percent / 100.0)
-                        role_capacity_data_for_chart.append({"Date": date_in_range_cap, "Capacity (h)": role_capacity_on_day})
+                    # System working hours of every day in the range, read from the calendar array in one slice
+                    capacity_working_calendar = WorkingCalendar(current_working_hours_prep, False, project_min_date_overall, len(dates_range_for_capacity_chart))
+                    daily_system_hours_for_cap = capacity_working_calendar.hours[:len(dates_range_for_capacity_chart)]
 
-                    role_capacity_df_for_plot = pd.DataFrame(role_capacity_data_for_chart)
+                    # Role's capacity for the day = system working hours * role's general availability %
+                    role_capacity_df_for_plot = pd.DataFrame({
+                        "Date": dates_range_for_capacity_chart,
+                        "Capacity (h)": daily_system_hours_for_cap * (role_availability_percent / 100.0),
+                    })
 
                     fig_role_workload = go.Figure()
                     # Plot actual load as bars
@@ -2497,10 +3185,10 @@ with tab_resources:
                         x=role_specific_load_df['Date'], y=role_specific_load_df['Load (h)'],
                         name=f'{selected_role_for_chart} Actual Load', marker_color='rgba(55, 83, 109, 0.7)'
                     ))
-                    # Plot capacity as a line
+                    # Plot capacity as a line (WebGL trace: stays responsive for multi-year daily series)
                     if not role_capacity_df_for_plot.empty:
-                        fig_role_workload.add_trace(go.Scatter(
-                            x=role_capacity_df_for_plot['Date'], y=role_capacity_df_for_plot['Capacity (h)'],
+                        fig_role_workload.add_trace(go.Scattergl(
+                            x=role_capacity_df_for_plot['Date'].to_numpy(), y=role_capacity_df_for_plot['Capacity (h)'].to_numpy(),
                             mode='lines', name=f'{selected_role_for_chart} Capacity',
                             line=dict(dash='solid', color='red', width=2)
                         ))
@@ -2536,7 +3224,7 @@ with tab_resources:
 
                 st.divider()
                 st.subheader("📊 Total Load Summary (Aggregated Person-Hours per Role)")
-                total_hours_summary_per_role = load_summary_for_charting.groupby('Role')['Load (h)'].sum().reset_index()
+                total_hours_summary_per_role = load_summary_for_charting.groupby('Role', sort=False, observed=True)['Load (h)'].sum().reset_index() # Sorted by total below
                 total_hours_summary_per_role.rename(columns={'Load (h)': 'Total Hours', 'Role': 'Role Name'}, inplace=True)
                 st.dataframe(
                     total_hours_summary_per_role.sort_values(by='Total Hours', ascending=False).style.format({'Total Hours': '{:,.1f} h'}),
@@ -2553,6 +3241,139 @@ with tab_resources:
 
 
 # --- Costs Tab ---
+@st.cache_data(ttl=3600, max_entries=8, show_spinner=False)
+def _build_cost_breakdowns(tasks_hash: str, roles_hash: str, config_hash: str, phases_hash: str, _tasks_df: pd.DataFrame, _roles_config: dict) -> tuple[pd.DataFrame | None, pd.DataFrame, dict]:
+    """
+    Builds the cost breakdown tables of the Costs tab and its filter options from the prepared task DataFrame.
+    Cached on the same fingerprints as _prepare_tasks_display_frame, so filter and other widget reruns reuse them.
+
+    Args:
+        tasks_hash: Fingerprint of the task list behind _tasks_df.
+        roles_hash: Fingerprint of _roles_config.
+        config_hash: Fingerprint of the project configuration behind _tasks_df.
+        phases_hash: Fingerprint of the phases configuration behind _tasks_df.
+        _tasks_df: The prepared task DataFrame (tasks_df_for_display, not modified).
+        _roles_config: Configuration of roles (hourly rates).
+
+    Returns:
+        A tuple: (cost_by_role_summary_df, cost_by_task_display_df, cost_filter_options)
+        - cost_by_role_summary_df: 'Role', 'Cost (€)' and its 'cost_display' text, sorted by cost, or None if no task has costed assignments.
+        - cost_by_task_display_df: 'id', 'Phase', 'Subtask', 'Estimated Cost (€)' and the task's 'cost_display' text, sorted by cost (descending).
+        - cost_filter_options (dict): sorted 'phases' and 'subtasks', and the set of subtasks of each phase ('subtasks_by_phase').
+    """
+    tasks_df, roles_config = _tasks_df, _roles_config
+    # One entry per task assignment (tasks with effort and a positive allocation sum); the cost math then runs on arrays
+    cost_assignment_roles, cost_assignment_allocations, cost_assignment_task_efforts, cost_assignment_allocation_sums = [], [], [], []
+    for effort_ph_for_cost_calc, task_assignments_for_cost in zip(tasks_df['effort_ph'], tasks_df['assignments']):
+        assignments_for_cost_calc = parse_assignments(task_assignments_for_cost) # Ensure parsed
+        if effort_ph_for_cost_calc > 0 and assignments_for_cost_calc:
+            # To distribute cost by role, we need to recalculate based on effort proportion for each role in this task
+            total_task_specific_allocation_sum_for_cost_dist = sum(assign_cost_dist.get('allocation', 0) for assign_cost_dist in assignments_for_cost_calc)
+            if total_task_specific_allocation_sum_for_cost_dist > 0:
+                for assign_cost_item_dist in assignments_for_cost_calc:
+                    cost_assignment_roles.append(assign_cost_item_dist.get('role'))
+                    cost_assignment_allocations.append(assign_cost_item_dist.get('allocation', 0))
+                    cost_assignment_task_efforts.append(effort_ph_for_cost_calc)
+                    cost_assignment_allocation_sums.append(total_task_specific_allocation_sum_for_cost_dist)
+
+    cost_by_role_summary_df = None
+    if cost_assignment_roles:
+        hourly_rate_by_role_for_cost = {role_name: roles_config.get(role_name, {}).get("rate_eur_hr", 0.0) for role_name in set(cost_assignment_roles)}
+        proportion_of_effort_per_assignment = np.array(cost_assignment_allocations, dtype=np.float64) / np.array(cost_assignment_allocation_sums, dtype=np.float64)
+        effort_per_assignment = np.array(cost_assignment_task_efforts, dtype=np.float64) * proportion_of_effort_per_assignment
+        hourly_rate_per_assignment = np.array([hourly_rate_by_role_for_cost[role_name] for role_name in cost_assignment_roles], dtype=np.float64)
+        cost_by_role_df_aggregated = pd.DataFrame({'Role': cost_assignment_roles, 'Cost (€)': effort_per_assignment * hourly_rate_per_assignment})
+        cost_by_role_df_aggregated['Role'] = cost_by_role_df_aggregated['Role'].astype('category')
+        cost_by_role_summary_df = cost_by_role_df_aggregated.groupby('Role', sort=False, observed=True)['Cost (€)'].sum().reset_index() # Sorted by cost below
+        cost_by_role_summary_df = cost_by_role_summary_df.sort_values(by='Cost (€)', ascending=False)
+        cost_by_role_summary_df['cost_display'] = "€ " + cost_by_role_summary_df['Cost (€)'].map("{:,.2f}".format) # Same text as the task editor's cost_display
+
+    # Sorted once here; the boolean mask filters in the Costs tab keep this order
+    cost_by_task_display_df = tasks_df[['id', 'phase', 'subtask', 'cost', 'cost_display']].rename(columns={'cost': 'Estimated Cost (€)', 'phase': 'Phase', 'subtask':'Subtask'})
+    cost_by_task_display_df = cost_by_task_display_df.sort_values(by='Estimated Cost (€)', ascending=False, ignore_index=True)
+    # Few distinct phases: categorical is sent to st.dataframe dictionary-encoded (costs stay float64 so totals keep their cents)
+    cost_by_task_display_df['Phase'] = cost_by_task_display_df['Phase'].astype('category')
+
+    # Sorted filter options, so filter interactions only look them up
+    cost_filter_options = {
+        'phases': sorted(cost_by_task_display_df['Phase'].unique()),
+        'subtasks': sorted(cost_by_task_display_df['Subtask'].unique()),
+        'subtasks_by_phase': {phase_name: set(phase_subtasks) for phase_name, phase_subtasks in cost_by_task_display_df.groupby('Phase', sort=False, observed=True)['Subtask']},
+    }
+    return cost_by_role_summary_df, cost_by_task_display_df, cost_filter_options
+
+@st.cache_resource(ttl=3600, max_entries=8, show_spinner=False)
+def _build_cost_by_role_pie_figure(tasks_hash: str, roles_hash: str, config_hash: str, phases_hash: str, _cost_by_role_summary_df: pd.DataFrame) -> go.Figure:
+    """
+    Builds the cost distribution pie chart from the cost by role summary of _build_cost_breakdowns.
+    Cached as a resource on the same fingerprints, like _build_gantt_figure (st.plotly_chart only reads the figure).
+
+    Args:
+        tasks_hash: Fingerprint of the task list behind the summary.
+        roles_hash: Fingerprint of the roles configuration behind the summary.
+        config_hash: Fingerprint of the project configuration behind the summary.
+        phases_hash: Fingerprint of the phases configuration behind the summary.
+        _cost_by_role_summary_df: The cost by role summary.
+
+    Returns:
+        The plotly pie figure.
+    """
+    fig_pie_chart_cost_by_role = px.pie(
+        _cost_by_role_summary_df, values='Cost (€)', names='Role',
+        title='Cost Distribution by Role', hole=0.3
+    )
+    fig_pie_chart_cost_by_role.update_traces(textposition='inside', textinfo='percent+label')
+    fig_pie_chart_cost_by_role.update_layout(showlegend=False, title_x=0.5, margin=dict(l=0, r=0, t=30, b=0))
+    return fig_pie_chart_cost_by_role
+
+@st.fragment
+def _render_cost_by_task_section(cost_by_task_display_df: pd.DataFrame, cost_filter_options: dict):
+    """
+    Renders the phase/subtask filters, the filtered cost by task table and its total.
+    Runs as a fragment: changing a filter reruns only this section, not the whole script.
+
+    Args:
+        cost_by_task_display_df: The cost by task table from _build_cost_breakdowns.
+        cost_filter_options: The filter options from _build_cost_breakdowns.
+    """
+    filter_col_phase_cost, filter_col_subtask_cost = st.columns(2)
+    with filter_col_phase_cost:
+        unique_phases_for_filter = cost_filter_options['phases']
+        selected_phases_filter = st.multiselect(
+            "Filter by Phase:", options=unique_phases_for_filter, default=[], key="filter_phase_cost_tab"
+        )
+    with filter_col_subtask_cost:
+        # Filter subtask options based on selected phases if any, else show all
+        if selected_phases_filter:
+            subtasks_options_for_filter = sorted(set().union(*(cost_filter_options['subtasks_by_phase'].get(phase_name, set()) for phase_name in selected_phases_filter)))
+        else:
+            subtasks_options_for_filter = cost_filter_options['subtasks']
+
+        selected_subtasks_filter = st.multiselect(
+            "Filter by Subtask:", options=subtasks_options_for_filter, default=[], key="filter_subtask_cost_tab"
+        )
+
+    # Both filters combined into one boolean mask; masking returns a new frame, so no defensive copy is needed
+    filtered_cost_by_task_df = cost_by_task_display_df
+    if selected_phases_filter or selected_subtasks_filter:
+        cost_filter_mask = np.ones(len(cost_by_task_display_df), dtype=bool)
+        if selected_phases_filter:
+            cost_filter_mask &= cost_by_task_display_df['Phase'].isin(selected_phases_filter).to_numpy()
+        if selected_subtasks_filter: # Applies on top of the phase filter
+            cost_filter_mask &= cost_by_task_display_df['Subtask'].isin(selected_subtasks_filter).to_numpy()
+        filtered_cost_by_task_df = cost_by_task_display_df[cost_filter_mask]
+
+    # Shows the precomputed cost text (no per-cell Styler formatting), the same "€ 1,234.56" as the task editor
+    st.dataframe(
+        filtered_cost_by_task_df,
+        column_order=('Phase', 'Subtask', 'cost_display'), # Hides 'id' and the numeric cost without a column-subset copy
+        column_config={'cost_display': st.column_config.TextColumn("Estimated Cost (€)")},
+        use_container_width=True, hide_index=True
+    )
+    # np.nansum skips NaN costs like Series.sum(), without the pandas reduction wrapper
+    total_filtered_task_cost = float(np.nansum(filtered_cost_by_task_df['Estimated Cost (€)'].to_numpy()))
+    st.info(f"**Total Cost of Filtered Tasks:** € {total_filtered_task_cost:,.2f}")
+
 with tab_costs:
     st.header("💰 Estimated Costs Summary")
     # Use the centrally prepared tasks_df_for_display
@@ -2593,47 +3414,22 @@ with tab_costs:
 
         st.divider()
         st.subheader("Cost Breakdown by Role")
-        cost_by_role_data_list = []
-        for _, task_cost_row_item in tasks_df_for_display.iterrows():
-            effort_ph_for_cost_calc = task_cost_row_item.get('effort_ph', 0.0)
-            assignments_for_cost_calc = parse_assignments(task_cost_row_item.get('assignments', [])) # Ensure parsed
-            if effort_ph_for_cost_calc > 0 and assignments_for_cost_calc:
-                # total_task_cost_from_df = task_cost_row_item.get('cost', 0.0) # Already calculated
-
-                # To distribute cost by role, we need to recalculate based on effort proportion for each role in this task
-                total_task_specific_allocation_sum_for_cost_dist = sum(assign_cost_dist.get('allocation', 0) for assign_cost_dist in assignments_for_cost_calc)
-
-                if total_task_specific_allocation_sum_for_cost_dist > 0:
-                    for assign_cost_item_dist in assignments_for_cost_calc:
-                        role_name_for_cost_dist = assign_cost_item_dist.get('role')
-                        role_allocation_percent_for_dist = assign_cost_item_dist.get('allocation', 0)
-
-                        proportion_of_effort_for_role_in_task = role_allocation_percent_for_dist / total_task_specific_allocation_sum_for_cost_dist
-                        effort_for_this_role_in_this_task = effort_ph_for_cost_calc * proportion_of_effort_for_role_in_task
-                        role_hourly_rate_for_calc = get_role_rate(role_name_for_cost_dist)
-                        cost_for_this_role_in_this_task = effort_for_this_role_in_this_task * role_hourly_rate_for_calc
-                        cost_by_role_data_list.append({'Role': role_name_for_cost_dist, 'Cost (€)': cost_for_this_role_in_this_task})
-
-        if cost_by_role_data_list:
-            cost_by_role_df_aggregated = pd.DataFrame(cost_by_role_data_list)
-            cost_by_role_summary_df = cost_by_role_df_aggregated.groupby('Role')['Cost (€)'].sum().reset_index()
-            cost_by_role_summary_df = cost_by_role_summary_df.sort_values(by='Cost (€)', ascending=False)
+        cost_by_role_summary_df, cost_by_task_display_df, cost_filter_options = _build_cost_breakdowns(*display_frame_input_hashes, tasks_df_for_display, current_roles_prep)
+
+        if cost_by_role_summary_df is not None:
 
             col_cost_table_by_role, col_cost_chart_by_role = st.columns([0.6, 0.4])
             with col_cost_table_by_role:
                 st.write("**Total Cost per Role**")
                 st.dataframe(
-                    cost_by_role_summary_df.style.format({'Cost (€)': '€ {:,.2f}'}),
+                    cost_by_role_summary_df,
+                    column_order=('Role', 'cost_display'),
+                    column_config={'cost_display': st.column_config.TextColumn("Cost (€)")},
                     use_container_width=True, hide_index=True
                 )
             with col_cost_chart_by_role:
-                if not cost_by_role_summary_df.empty and cost_by_role_summary_df['Cost (€)'].sum() > 0:
-                    fig_pie_chart_cost_by_role = px.pie(
-                        cost_by_role_summary_df, values='Cost (€)', names='Role',
-                        title='Cost Distribution by Role', hole=0.3
-                    )
-                    fig_pie_chart_cost_by_role.update_traces(textposition='inside', textinfo='percent+label')
-                    fig_pie_chart_cost_by_role.update_layout(showlegend=False, title_x=0.5, margin=dict(l=0, r=0, t=30, b=0))
+                if cost_by_role_summary_df['Cost (€)'].to_numpy().sum() > 0: # An empty array sums to 0, so this also covers no roles
+                    fig_pie_chart_cost_by_role = _build_cost_by_role_pie_figure(*display_frame_input_hashes, cost_by_role_summary_df)
                     st.plotly_chart(fig_pie_chart_cost_by_role, use_container_width=True)
                 else:
                     st.info("No positive costs to display in the role distribution chart.")
@@ -2642,40 +3438,9 @@ with tab_costs:
 
         st.divider()
         st.subheader("Cost Breakdown by Task")
-        cost_by_task_display_df = tasks_df_for_display[['id', 'phase', 'subtask', 'cost']].copy()
-        cost_by_task_display_df.rename(columns={'cost': 'Estimated Cost (€)', 'phase': 'Phase', 'subtask':'Subtask'}, inplace=True)
-
-        filter_col_phase_cost, filter_col_subtask_cost = st.columns(2)
-        with filter_col_phase_cost:
-            unique_phases_for_filter = sorted(cost_by_task_display_df['Phase'].unique())
-            selected_phases_filter = st.multiselect(
-                "Filter by Phase:", options=unique_phases_for_filter, default=[], key="filter_phase_cost_tab"
-            )
-        with filter_col_subtask_cost:
-            # Filter subtask options based on selected phases if any, else show all
-            subtasks_options_for_filter = cost_by_task_display_df['Subtask'].unique()
-            if selected_phases_filter:
-                subtasks_options_for_filter = sorted(cost_by_task_display_df[cost_by_task_display_df['Phase'].isin(selected_phases_filter)]['Subtask'].unique())
-            else:
-                subtasks_options_for_filter = sorted(subtasks_options_for_filter)
+        # cost_by_task_display_df comes from _build_cost_breakdowns above
 
-            selected_subtasks_filter = st.multiselect(
-                "Filter by Subtask:", options=subtasks_options_for_filter, default=[], key="filter_subtask_cost_tab"
-            )
-
-        filtered_cost_by_task_df = cost_by_task_display_df.copy()
-        if selected_phases_filter:
-            filtered_cost_by_task_df = filtered_cost_by_task_df[filtered_cost_by_task_df['Phase'].isin(selected_phases_filter)]
-        if selected_subtasks_filter: # This will further filter the already phase-filtered df
-            filtered_cost_by_task_df = filtered_cost_by_task_df[filtered_cost_by_task_df['Subtask'].isin(selected_subtasks_filter)]
-
-        filtered_cost_by_task_df = filtered_cost_by_task_df.sort_values(by='Estimated Cost (€)', ascending=False)
-        st.dataframe(
-            filtered_cost_by_task_df[['Phase', 'Subtask', 'Estimated Cost (€)']].style.format({'Estimated Cost (€)': '€ {:,.2f}'}),
-            use_container_width=True, hide_index=True
-        )
-        total_filtered_task_cost = filtered_cost_by_task_df['Estimated Cost (€)'].sum()
-        st.info(f"**Total Cost of Filtered Tasks:** € {total_filtered_task_cost:,.2f}")
+        _render_cost_by_task_section(cost_by_task_display_df, cost_filter_options)
 
     elif not tasks_df_for_display.empty: # Tasks exist, but cost column might be missing or all NaN
         st.warning("Could not calculate or display costs. Ensure tasks have effort and assignments, and roles have defined rates. Also, check if the 'cost' column is properly calculated.")